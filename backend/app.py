@@ -3,14 +3,26 @@ from flask_cors import CORS
 from datetime import datetime as dt
 import os
 from werkzeug.utils import secure_filename
-from services.crud import get_player_cumsum_scores
-from services.db_manager import DbManager
+from services.crud import get_player_cumsum_scores, decode_cursor, parse_game_booking, book_games
+from pydantic import ValidationError
+from services.record_parser import RecordParseError
+from services.db_manager import DbManager, pool_stats
+from services.cache import result_cache, DbVersionSource
+from services.ocr_jobs import OcrJobManager
+from services.ocr_cache import ocr_cache
+from services.ocr_metrics import ocr_stats
+from services.pic_dedupe import find_duplicate, register
+from services.upload import StreamingUploadRequest, normalize_image, upload_image_suffix
+from services.json_response import fast_json_response, compress_response
+from PIL import Image, UnidentifiedImageError
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
 app = Flask(__name__)
+# 上传文件直接分块写入磁盘
+app.request_class = StreamingUploadRequest
 
 # CORS配置
 cors_origins = os.getenv('CORS_ORIGINS', '*')
@@ -38,10 +50,15 @@ app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', './uploads')
 # 确保上传文件夹存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+db_manager = DbManager(app)
+# 缓存版本号从数据库读取，其他 worker 或批量导入的写入也会使缓存失效
+result_cache.configure(version_source=DbVersionSource(
+    db_manager.get_conn, check_interval=float(os.getenv('CACHE_VERSION_CHECK_INTERVAL', 1))
+))
+ocr_job_manager = OcrJobManager(db_manager.new_session)
+
 def init_sys():
     try:
-        db_manager = DbManager(app)
-
         # 检查mysql服务是否启动，如果未启动，则启动
         print("🔍 检查MySQL服务状态...")
         if not db_manager.check_and_start_mysql():
@@ -53,12 +70,24 @@ def init_sys():
             return False
         
         print("✅ MySQL服务运行正常")
+
+        # 补建缺少的表和索引，旧数据库首次升级时回填累计分数物化表
+        db_manager.ensure_schema_once()
+
+        # 重新排队上次未完成的OCR任务
+        ocr_job_manager.recover_once()
         
         return True
     except Exception as e:
         print(f"❌ 系统初始化失败: {e}")
         return False
 
+@app.before_request
+def recover_ocr_jobs():
+    """gunicorn 等不经过 init_sys 启动的 worker 在处理第一个请求前检查表结构并恢复未完成的OCR任务"""
+    db_manager.ensure_schema_once()
+    ocr_job_manager.recover_once()
+
 @app.route('/')
 def home():
     """首页路由"""
@@ -71,13 +100,22 @@ def home():
 
 @app.route('/api/health')
 def health_check():
-    """健康检查接口"""
-    return jsonify({
+    """健康检查接口，?ready=1 时同时探测MySQL能否接受连接，未就绪返回 503"""
+    result = {
         'status': 'healthy',
         'service': 'flask-backend',
         'timestamp': dt.now().isoformat(),
         'environment': os.getenv('FLASK_ENV', 'development')
-    })
+    }
+    if request.args.get('ready') not in (None, '', '0', 'false'):
+        ready, message = db_manager.mysql_manager.probe_mysql(
+            timeout=float(os.getenv('HEALTH_PROBE_TIMEOUT', 1))
+        )
+        result['database'] = {'ready': ready, 'detail': message}
+        if not ready:
+            result['status'] = 'unavailable'
+            return jsonify(result), 503
+    return jsonify(result)
 
 @app.route('/api/enterAuth')
 def enter_auth():
@@ -97,9 +135,9 @@ def enter_auth():
             'message': 'password 验证失败'
         })
 
-@app.route('/api/uploadRecordPic')
+@app.route('/api/uploadRecordPic', methods=['POST'])
 def upload_record_pic():
-    """上传记录图片接口"""
+    """上传记录图片接口，保存图片并提交OCR任务"""
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
@@ -109,24 +147,230 @@ def upload_record_pic():
         return jsonify({'error': 'No selected file'}), 400
     
     if file:
-        filename = secure_filename(file.filename)
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        # 加上时间戳前缀，避免同名文件互相覆盖；统一保存为 upload_image_format
+        stem = os.path.splitext(secure_filename(file.filename))[0]
+        filename = f"{dt.now().strftime('%Y%m%d%H%M%S%f')}_{stem}{upload_image_suffix}"
+        pic_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+
+        # 文件在上传过程中已经写入临时文件并计算了哈希
+        content_hash = file.stream.hexdigest()
+        try:
+            normalize_image(file.stream, pic_path)
+        except (UnidentifiedImageError, OSError):
+            return jsonify({'error': '不是有效的图片'}), 400
+        finally:
+            file.stream.close()
+
+        # 相同或近似的图片已经识别过时直接返回原任务，不再重复识别
+        session = db_manager.get_session()
+        try:
+            with Image.open(pic_path) as image:
+                job_id = find_duplicate(session, content_hash, image)
+                duplicate = job_id is not None
+                if duplicate:
+                    os.remove(pic_path)
+                else:
+                    job_id = ocr_job_manager.submit(pic_path, filename)
+                    register(session, content_hash, image, job_id)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            db_manager.close_session()
+
+        job = ocr_job_manager.get_job(job_id) if duplicate else None
         return jsonify({
             'status': 'success',
-            'message': '图片上传成功',
-            'filename': filename
+            'message': '图片已识别过' if duplicate else '图片上传成功',
+            'filename': filename,
+            'job_id': job_id,
+            'duplicate': duplicate,
+            'result': job['result'] if job else None
         })
     else:
         return jsonify({'error': 'Failed to upload file'}), 500
 
+@app.route('/api/getOcrJob')
+def get_ocr_job():
+    """查询OCR任务状态接口"""
+    job_id = request.args.get('job_id')
+    job = ocr_job_manager.get_job(job_id) if job_id else None
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+
+    return jsonify({
+        'data': job,
+        'status': 'success',
+        'message': '获取OCR任务成功'
+    })
+
+@app.route('/api/getOcrStats')
+def get_ocr_stats():
+    """获取OCR统计接口"""
+    return jsonify({
+        'data': {
+            'pipeline': ocr_stats.snapshot(),
+            'cache': ocr_cache.stats()
+        },
+        'status': 'success',
+        'message': '获取OCR统计成功'
+    })
+
+@app.route('/api/bookGames', methods=['POST'])
+def book_games_api():
+    """批量登记牌局接口，请求体为单个牌局或 {"games": [...], "fuzzy_names": false}
+
+    fuzzy_names 为 true 时玩家名按 OCR 结果处理，找不到同名玩家时模糊匹配已有玩家。
+    """
+    payload = request.get_json(silent=True)
+    fuzzy_names = False
+    if isinstance(payload, dict) and 'games' in payload:
+        fuzzy_names = bool(payload.get('fuzzy_names', False))
+        payload = payload['games']
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list) or not payload:
+        return jsonify({'error': '请求数据为空'}), 400
+
+    try:
+        games = [parse_game_booking(game) for game in payload]
+    except RecordParseError as e:
+        return jsonify({'error': '牌局数据校验失败', 'errors': e.errors}), 400
+    except (ValidationError, TypeError, AttributeError) as e:
+        return jsonify({'error': f'牌局数据格式错误: {e}'}), 400
+
+    session = db_manager.get_session()
+    try:
+        game_ids, skipped = book_games(session, games, fuzzy_names=fuzzy_names)
+        session.commit()
+    except RecordParseError as e:
+        session.rollback()
+        return jsonify({'error': '牌局数据校验失败', 'errors': e.errors}), 400
+    except Exception as e:
+        session.rollback()
+        print(f"登记牌局失败: {e}")
+        return jsonify({'error': '登记牌局失败'}), 500
+    finally:
+        db_manager.close_session()
+
+    return jsonify({
+        'data': {
+            'game_ids': game_ids,
+            # 已经登记过的牌局，按 (开始时间, 牌局名, 创建者) 判断
+            'skipped': [
+                {'start_time': start_time.isoformat(), 'game_name': game_name, 'creator_player_name': creator}
+                for start_time, game_name, creator in skipped
+            ]
+        },
+        'status': 'success',
+        'message': f'成功登记 {len(game_ids)} 局，跳过已登记 {len(skipped)} 局'
+    })
+
+def parse_player_record_args(args):
+    """解析玩家记录接口的查询参数，返回 read_player_cumsum_window 的过滤条件，参数有误时抛出 ValueError
+
+    since/until: 开始时间范围（ISO 格式，只给日期时 until 包含当天）
+    player_ids: 逗号分隔的玩家ID；players: 逗号分隔的玩家名
+    last_games: 最近 N 局；limit: 每页局数（默认 PLAYER_RECORD_DEFAULT_LIMIT）；cursor: 上一页返回的 next_cursor
+    format: records（默认，逐行记录）或 columnar（牌局轴、玩家轴和每位玩家的累计分数数组）
+    没有 since、last_games、cursor 时默认取最近 limit 局，窗口终点是最新一局，
+    最后一局的累计分数即当前总分；给出 since 时从 since 起按时间正序分页。
+    """
+    filters = {}
+    response_format = args.get('format', 'records')
+    if response_format not in ('records', 'columnar'):
+        raise ValueError(f"不支持的格式: {response_format}")
+    if response_format == 'columnar':
+        filters['columnar'] = True
+    for key in ('since', 'until'):
+        value = args.get(key)
+        if value:
+            parsed = dt.fromisoformat(value)
+            if key == 'until' and len(value) == 10:
+                parsed = dt.combine(parsed.date(), dt.max.time())
+            filters[key] = parsed
+    if args.get('player_ids'):
+        filters['player_ids'] = sorted({int(v) for v in args['player_ids'].split(',') if v.strip()})
+    if args.get('players'):
+        filters['player_names'] = sorted({v.strip() for v in args['players'].split(',') if v.strip()})
+    for key in ('last_games', 'limit'):
+        if args.get(key):
+            value = int(args[key])
+            if value <= 0:
+                raise ValueError(f"{key} 必须大于 0")
+            filters[key] = value
+    # 总是分页，响应大小不随历史数据增长
+    max_limit = int(os.getenv('PLAYER_RECORD_MAX_LIMIT', 500))
+    default_limit = int(os.getenv('PLAYER_RECORD_DEFAULT_LIMIT', 200))
+    filters['limit'] = min(filters.get('limit', default_limit), max_limit)
+    if args.get('cursor'):
+        filters['after'] = decode_cursor(args['cursor'])
+    # 没有指定起点时取最近的一页，而不是历史上最早的一页
+    if not any(key in filters for key in ('since', 'last_games', 'after')):
+        filters['last_games'] = filters['limit']
+    return filters
+
 @app.route('/api/getPlayerRecord')
 def get_player_record():
-    """获取玩家记录接口"""
-    data = get_player_cumsum_scores()
-    return jsonify({
-        'data': data,
+    """获取玩家记录接口，支持按时间、玩家、最近 N 局过滤和游标分页
+
+    响应的 data 按玩家、牌局时间正序排列，page 为 {games_count, has_more, next_cursor}。
+    不带参数时返回最近 PLAYER_RECORD_DEFAULT_LIMIT 局（截至最新一局的当前累计分数）；
+    需要更早的历史时用 since/until 指定时间范围，再按 next_cursor 翻页。
+    """
+    try:
+        filters = parse_player_record_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'查询参数错误: {e}'}), 400
+
+    # 缓存键和 ETag 包含规范化后的查询参数；缓存条目数有上限，任意参数组合不会让内存无限增长
+    cache_name = 'player_record:' + '&'.join(f"{key}={filters[key]}" for key in sorted(filters))
+
+    # 数据未变化时浏览器直接使用本地缓存，压缩后的响应 ETag 带压缩方式后缀
+    etag = result_cache.etag(cache_name)
+    if any(request.if_none_match.contains(tag) for tag in (etag, f'{etag}-gzip', f'{etag}-br')):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    page = result_cache.get_or_compute(
+        cache_name,
+        lambda: get_player_cumsum_scores(**filters),
+        cache_if=lambda page: page['games_count'] > 0
+    )
+    payload = {
+        'data': page['data'],
+        'page': {
+            'games_count': page['games_count'],
+            'has_more': page['has_more'],
+            'next_cursor': page['next_cursor']
+        },
         'status': 'success',
         'message': '获取玩家记录成功'
+    }
+    # 列式结构只含整数和字符串，用更快的编码器；逐行记录保持原有的时间格式
+    response = fast_json_response(payload) if filters.get('columnar') else jsonify(payload)
+    encoding = compress_response(response)
+    response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+    return response
+
+@app.route('/api/getCacheStats')
+def get_cache_stats():
+    """获取缓存命中统计接口"""
+    return jsonify({
+        'data': result_cache.stats(),
+        'status': 'success',
+        'message': '获取缓存统计成功'
+    })
+
+@app.route('/api/getDbPoolStats')
+def get_db_pool_stats():
+    """获取数据库连接池状态接口"""
+    return jsonify({
+        'data': pool_stats(),
+        'status': 'success',
+        'message': '获取连接池状态成功'
     })
 
 @app.errorhandler(404)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+批量导入记录截图
+遍历目录或通配符匹配的截图，多进程识别后逐行写入 JSONL，可选分批登记到MySQL。
+中断后重新运行同样的命令会跳过已经识别或登记过的图片。
+
+用法:
+    python batch_import.py ../uploads -o import.jsonl --workers 4
+    python batch_import.py "../history/*.jpg" -o import.jsonl --book --batch-size 50
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+# 添加当前目录到Python路径
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+PIC_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+
+def collect_pic_paths(inputs):
+    """展开目录和通配符，返回排序后的图片绝对路径"""
+    paths = set()
+    for item in inputs:
+        matches = glob.glob(item, recursive=True) or [item]
+        for match in matches:
+            match = Path(match)
+            if match.is_dir():
+                candidates = match.rglob('*')
+            else:
+                candidates = [match]
+            for candidate in candidates:
+                if candidate.is_file() and candidate.suffix.lower() in PIC_SUFFIXES:
+                    paths.add(str(candidate.resolve()))
+    return sorted(paths)
+
+
+def load_progress(output_path):
+    """读取已有的 JSONL 结果，返回 {图片路径: 结果}"""
+    done = {}
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次中断时可能写了半行
+                continue
+            done[item['path']] = item
+    return done
+
+
+def load_booked(booked_path):
+    if not os.path.exists(booked_path):
+        return set()
+    with open(booked_path, encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化: {type(value)}")
+
+
+def _init_worker(ocr_threads, mode):
+    # fork 前父进程已经建立的连接池不能在子进程中复用
+    if 'services.db_manager' in sys.modules:
+        from services.db_manager import dispose_engines
+        dispose_engines(close=False)
+
+    from services import pic_reading
+    pic_reading.set_ocr_max_workers(ocr_threads)
+    if mode:
+        pic_reading.ocr_mode = mode
+
+
+def parse_pic(path):
+    """在子进程中识别并解析一张图片"""
+    from services.pic_reading import pic_to_json
+    from services.record_parser import parse_record
+
+    started = time.perf_counter()
+    try:
+        result = pic_to_json(path)
+        parsed, errors = parse_record(result)
+        item = {'path': path, 'status': 'done', 'result': result, 'parsed': parsed, 'errors': errors}
+    except Exception as e:
+        item = {'path': path, 'status': 'failed', 'error': str(e)}
+    item['seconds'] = round(time.perf_counter() - started, 3)
+    return json.loads(json.dumps(item, ensure_ascii=False, default=_json_default))
+
+
+def book_items(items, booked_path, batch_size):
+    """把解析无误的结果分批登记到MySQL，每批一个事务
+
+    book_games 按 (开始时间, 牌局名, 创建者) 去重：同一截图的多个副本、换了输出文件重跑，
+    或已经通过接口登记过的牌局都不会重复登记。
+    """
+    from services.db_manager import DbManager
+    from services.crud import parse_game_booking, book_games
+    from services.record_parser import RecordParseError
+
+    db_manager = DbManager()
+    booked_count = 0
+    skipped_count = 0
+
+    def book_batch(games):
+        """在一个事务中登记一批牌局，返回 (新牌局的ID, 跳过的牌局)"""
+        session = db_manager.get_session()
+        try:
+            # 玩家名直接来自 OCR，允许模糊匹配已有玩家
+            result = book_games(session, games, fuzzy_names=True)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            db_manager.close_session()
+
+    with open(booked_path, 'a', encoding='utf-8') as booked_file:
+        for i in range(0, len(items), batch_size):
+            batch = items[i:i + batch_size]
+            games = [parse_game_booking(item['parsed']) for item in batch]
+            rejected = set()
+            try:
+                game_ids, skipped = book_batch(games)
+            except RecordParseError:
+                # 个别牌局的玩家对应有冲突时逐局登记，只跳过有冲突的牌局
+                game_ids, skipped = [], []
+                for item, game in zip(batch, games):
+                    try:
+                        ids, keys = book_batch([game])
+                    except RecordParseError as e:
+                        print(f"⚠️ 跳过 {item['path']}: {e}")
+                        rejected.add(item['path'])
+                        continue
+                    game_ids += ids
+                    skipped += keys
+            for item in batch:
+                if item['path'] not in rejected:
+                    booked_file.write(item['path'] + '\n')
+            booked_file.flush()
+            booked_count += len(game_ids)
+            skipped_count += len(skipped)
+            print(f"📦 已登记 {booked_count} 局，跳过重复 {skipped_count} 局，进度 {i + len(batch)}/{len(items)}")
+    return booked_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量识别记录截图')
+    parser.add_argument('inputs', nargs='+', help='图片目录、文件或通配符')
+    parser.add_argument('-o', '--output', default='import.jsonl', help='结果输出的 JSONL 文件')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='识别进程数')
+    parser.add_argument('--ocr-threads', type=int, default=2, help='每个进程内的 OCR 并发数')
+    parser.add_argument('--mode', choices=['crop', 'layout'], help='OCR 模式')
+    parser.add_argument('--retry-failed', action='store_true', help='重新识别上次失败的图片')
+    parser.add_argument('--book', action='store_true', help='识别后登记到MySQL')
+    parser.add_argument('--batch-size', type=int, default=50, help='每个事务登记的牌局数')
+    args = parser.parse_args()
+
+    paths = collect_pic_paths(args.inputs)
+    progress = load_progress(args.output)
+    pending = [
+        path for path in paths
+        if path not in progress or (args.retry_failed and progress[path]['status'] == 'failed')
+    ]
+    print(f"🔍 共 {len(paths)} 张图片，已完成 {len(paths) - len(pending)} 张，待识别 {len(pending)} 张")
+
+    started = time.perf_counter()
+    finished = 0
+    with open(args.output, 'a', encoding='utf-8') as output_file, \
+            ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=_init_worker,
+                initargs=(args.ocr_threads, args.mode)
+            ) as executor:
+        futures = [executor.submit(parse_pic, path) for path in pending]
+        for future in as_completed(futures):
+            item = future.result()
+            output_file.write(json.dumps(item, ensure_ascii=False) + '\n')
+            output_file.flush()
+            progress[item['path']] = item
+            finished += 1
+            elapsed = time.perf_counter() - started
+            status = '✅' if item['status'] == 'done' and not item.get('errors') else '⚠️ '
+            print(f"{status} [{finished}/{len(pending)}] {item['path']} "
+                  f"({finished / elapsed:.2f} 张/秒)")
+
+    elapsed = time.perf_counter() - started
+    if finished:
+        print(f"🚀 识别完成: {finished} 张, 用时 {elapsed:.1f} 秒, {finished / elapsed:.2f} 张/秒")
+
+    invalid = {p for p in paths if progress[p]['status'] != 'done' or progress[p].get('errors')}
+    if invalid:
+        print(f"⚠️  {len(invalid)} 张图片识别失败或校验未通过，不会登记，详见 {args.output}")
+
+    if args.book:
+        booked_path = args.output + '.booked'
+        booked = load_booked(booked_path)
+        to_book = [
+            progress[p] for p in paths
+            if p not in booked and p not in invalid
+        ]
+        # 按开始时间登记，每批只需刷新一次之后的累计分数
+        to_book.sort(key=lambda item: item['parsed']['start_time'])
+        print(f"\n📦 待登记 {len(to_book)} 局，已登记 {len(booked)} 局")
+        try:
+            book_items(to_book, booked_path, args.batch_size)
+        except Exception as e:
+            print(f"❌ 登记失败: {e}")
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
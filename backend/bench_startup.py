@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准
+在新的解释器中多次导入 app，统计导入耗时的中位数，超过预算或提前加载了较重的模块时返回非 0，
+可以放在部署流水线里防止启动变慢。
+
+用法:
+    python bench_startup.py
+    python bench_startup.py --repeat 10 --budget-ms 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+current_dir = Path(__file__).parent
+
+# 导入 app 时不应加载的模块，它们只在第一次识别图片或计算分数时才需要
+LAZY_MODULES = ['pandas', 'numpy', 'cv2', 'pytesseract', 'pymysql']
+
+# 子进程中执行的导入脚本，输出导入耗时、提前加载的模块和已创建的引擎数
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+from services.db_manager import _engines
+print(json.dumps({{
+    'import_ms': elapsed * 1000,
+    'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules],
+    'engines': len(_engines),
+}}))
+"""
+
+
+def measure_once():
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=current_dir,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    # app 导入时可能有其他输出，结果在最后一行
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量导入 app 的耗时')
+    parser.add_argument('--repeat', type=int, default=5, help='测量次数')
+    parser.add_argument('--budget-ms', type=float,
+                        default=float(os.getenv('STARTUP_IMPORT_BUDGET_MS', 800)),
+                        help='导入耗时中位数的上限（毫秒）')
+    args = parser.parse_args()
+
+    results = [measure_once() for _ in range(args.repeat)]
+    timings = [result['import_ms'] for result in results]
+    median = statistics.median(timings)
+    print(f"⏱️  导入 app: 中位数 {median:.0f}ms，最快 {min(timings):.0f}ms，最慢 {max(timings):.0f}ms")
+
+    failed = False
+    loaded = sorted({m for result in results for m in result['loaded']})
+    if loaded:
+        print(f"❌ 导入时加载了较重的模块: {', '.join(loaded)}")
+        failed = True
+    if any(result['engines'] for result in results):
+        print("❌ 导入时创建了数据库引擎")
+        failed = True
+    if median > args.budget_ms:
+        print(f"❌ 超过预算 {args.budget_ms:.0f}ms")
+        failed = True
+
+    if failed:
+        return 1
+    print(f"✅ 在预算 {args.budget_ms:.0f}ms 以内")
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
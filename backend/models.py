@@ -1,7 +1,8 @@
 # coding: utf-8
 
 from sqlalchemy import Integer, Column, Date, DateTime, \
-    Float, ForeignKey, String, TEXT, func, BLOB, DECIMAL, DOUBLE
+    Float, ForeignKey, String, TEXT, func, BLOB, DECIMAL, DOUBLE, \
+    Index, UniqueConstraint, LargeBinary, BigInteger
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -17,7 +18,11 @@ class Players(Base):
 
 class Games(Base):
     __tablename__ = "games"
-    __table_args__ = {'schema': 'langhuo_db', 'comment': '牌局信息表'}
+    __table_args__ = (
+        # 按时间窗口查询牌局
+        Index('ix_games_start_time_id', 'start_time', 'id'),
+        {'schema': 'langhuo_db', 'comment': '牌局信息表'}
+    )
 
     id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
     name = Column(String(128), nullable=False)
@@ -32,7 +37,13 @@ class Games(Base):
 
 class GameRecords(Base):
     __tablename__ = "game_records"
-    __table_args__ = {'schema': 'langhuo_db', 'comment': '牌局记录表'}
+    __table_args__ = (
+        # 按玩家查询历史记录
+        Index('ix_game_records_player_game', 'player_id', 'game_id'),
+        # 按牌局查询参与者
+        Index('ix_game_records_game', 'game_id'),
+        {'schema': 'langhuo_db', 'comment': '牌局记录表'}
+    )
 
     id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
     game_id = Column(Integer, ForeignKey('langhuo_db.games.id'), nullable=False)
@@ -42,5 +53,55 @@ class GameRecords(Base):
     score = Column(Integer, nullable=False)
 
 
+class PlayerCumulativeScores(Base):
+    __tablename__ = "player_cumulative_scores"
+    __table_args__ = (
+        UniqueConstraint('player_id', 'game_id', name='uq_player_cumulative_scores_player_game'),
+        Index('ix_player_cumulative_scores_player_start', 'player_id', 'start_time'),
+        Index('ix_player_cumulative_scores_start', 'start_time'),
+        {'schema': 'langhuo_db', 'comment': '玩家累计分数物化表'}
+    )
 
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    player_id = Column(Integer, ForeignKey('langhuo_db.players.id'), nullable=False)
+    game_id = Column(Integer, ForeignKey('langhuo_db.games.id'), nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    score = Column(Integer, nullable=False)
+    cumulative_score = Column(Integer, nullable=False)
+
+
+class OcrJobs(Base):
+    __tablename__ = "ocr_jobs"
+    __table_args__ = (
+        Index('ix_ocr_jobs_status', 'status'),
+        {'schema': 'langhuo_db', 'comment': 'OCR任务表'}
+    )
+
+    id = Column(String(32), primary_key=True, nullable=False)
+    filename = Column(String(255), nullable=False)
+    pic_path = Column(String(512), nullable=False)
+    status = Column(String(16), nullable=False)
+    result = Column(TEXT)
+    error = Column(TEXT)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
+
+class RecordPicIndex(Base):
+    __tablename__ = "record_pic_index"
+    __table_args__ = {'schema': 'langhuo_db', 'comment': '记录图片去重索引表'}
+
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    content_hash = Column(String(64), nullable=False, unique=True)
+    perceptual_hash = Column(LargeBinary(128), nullable=False)
+    job_id = Column(String(32), ForeignKey('langhuo_db.ocr_jobs.id'), nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class DataVersions(Base):
+    __tablename__ = "data_versions"
+    __table_args__ = {'schema': 'langhuo_db', 'comment': '数据版本号表，写入牌局时递增，用于各进程的接口缓存失效'}
 
+    name = Column(String(64), primary_key=True, nullable=False)
+    version = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,249 @@
+# 接口结果缓存
+# 以数据版本号为键，GameRecords/Games 等表有写入时版本号自增，旧缓存自然失效。
+# 版本号保存在 data_versions 表中并在写入事务内递增，其他 worker、批量导入等进程的写入同样会使缓存失效
+import hashlib
+import os
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.orm import Session
+from models import DataVersions
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 写入这些表时缓存失效
+INVALIDATING_TABLES = {'games', 'game_records', 'players', 'player_cumulative_scores'}
+
+DATA_VERSION_KEY = 'data_version'
+# data_versions 表中的版本号名称
+DATA_VERSION_NAME = 'game_data'
+
+
+class MemoryCacheBackend:
+    """进程内缓存后端，超过 max_entries 时淘汰最久未使用的条目
+
+    可替换为其他后端（如 Redis），只需实现相同的 token/get/set/incr/delete_prefix 接口
+    """
+
+    def __init__(self, max_entries=256):
+        # 区分不同进程的缓存，避免多个 worker 生成相同的 ETag
+        self.token = uuid.uuid4().hex
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        # incr 维护的计数器（数据版本号）不参与淘汰
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DbVersionSource:
+    """从 data_versions 表读取数据版本号，多个进程共享，最多每 check_interval 秒查询一次"""
+
+    def __init__(self, get_conn, check_interval=1.0):
+        self.get_conn = get_conn
+        self.check_interval = check_interval
+        self._version = None
+        self._checked_at = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if self._version is None or now - self._checked_at >= self.check_interval:
+            stmt = select(DataVersions.version).where(DataVersions.name == DATA_VERSION_NAME)
+            with self.get_conn() as conn:
+                self._version = conn.execute(stmt).scalar() or 0
+            self._checked_at = now
+        return self._version
+
+    def expire(self):
+        """本进程提交写入后立即重新读取"""
+        self._version = None
+
+
+class ResultCache:
+    """按数据版本号缓存接口结果，并统计命中率"""
+
+    def __init__(self, backend=None, version_source=None):
+        self.backend = backend or MemoryCacheBackend()
+        self.version_source = version_source
+        self.hits = 0
+        self.misses = 0
+        self._seen_version = None
+        self._lock = threading.Lock()
+
+    def configure(self, backend=None, version_source=None):
+        """切换缓存后端或版本号来源"""
+        if backend is not None:
+            self.backend = backend
+        if version_source is not None:
+            self.version_source = version_source
+
+    @property
+    def data_version(self):
+        if self.version_source is None:
+            return self.backend.get(DATA_VERSION_KEY, 0)
+        try:
+            version = self.version_source.get()
+        except Exception as e:
+            # 读不到共享版本号时退回本进程的版本号
+            logger.warning(f"读取数据版本号失败: {e}")
+            return f"local-{self.backend.get(DATA_VERSION_KEY, 0)}"
+        if version != self._seen_version:
+            # 其他进程写入了数据，丢弃旧版本的缓存
+            self.backend.delete_prefix('result:')
+            self._seen_version = version
+        return version
+
+    def bump_version(self):
+        """本进程有写入时调用，使所有缓存失效"""
+        version = self.backend.incr(DATA_VERSION_KEY)
+        self.backend.delete_prefix('result:')
+        if self.version_source is not None:
+            self.version_source.expire()
+        logger.info(f"数据版本更新: {version}")
+        return version
+
+    def etag(self, name, version=None):
+        """根据缓存名和数据版本号生成 ETag
+
+        版本号来自数据库时各进程生成相同的 ETag，否则加上本进程的标识以免不同 worker 冲突。
+        """
+        version = self.data_version if version is None else version
+        scope = 'db' if self.version_source is not None else self.backend.token
+        raw = f"{scope}:{name}:{version}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get_or_compute(self, name, compute, cache_if=None):
+        """命中则直接返回缓存结果，否则计算并写入缓存
+
+        cache_if: 可选的判断函数，返回 False 时不缓存本次结果（例如查询失败返回的空结果）
+        """
+        version = self.data_version
+        key = f"result:{name}:{version}"
+        value = self.backend.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        value = compute()
+        if cache_if is None or cache_if(value):
+            self.backend.set(key, value)
+        return value
+
+    def stats(self):
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'data_version': self.data_version,
+            'entries': len(self.backend) if hasattr(self.backend, '__len__') else None,
+        }
+
+
+result_cache = ResultCache(MemoryCacheBackend(max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 256))))
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_dirty_after_flush(session, flush_context):
+    """ORM 对象写入相关表时标记会话"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if getattr(obj, '__tablename__', None) in INVALIDATING_TABLES:
+            session.info['cache_dirty'] = True
+            return
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_dirty_on_execute(orm_execute_state):
+    """批量 insert/update/delete 语句写入相关表时标记会话"""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if getattr(table, 'name', None) in INVALIDATING_TABLES:
+        orm_execute_state.session.info['cache_dirty'] = True
+
+
+def bump_db_version(session):
+    """在当前事务中递增 data_versions 中的版本号
+
+    update 会对版本号行加排他锁直到事务结束，写入牌局前先调用可以让各进程的写入事务依次执行。
+    同一事务只递增一次。
+    """
+    if session.info.get('data_version_bumped'):
+        return
+    session.info['data_version_bumped'] = True
+    result = session.execute(
+        update(DataVersions)
+        .where(DataVersions.name == DATA_VERSION_NAME)
+        .values(version=DataVersions.version + 1)
+    )
+    if result.rowcount == 0:
+        # 以当前时间作为初始值，重建数据库后不会与客户端缓存的旧 ETag 重复
+        session.execute(insert(DataVersions).values(name=DATA_VERSION_NAME, version=int(time.time())))
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_db_version_before_commit(session):
+    """写入相关表的事务提交前，在同一事务中递增共享的版本号"""
+    # 提交时才 flush 的对象也要先标记
+    session.flush()
+    if session.info.get('cache_dirty'):
+        bump_db_version(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_version_after_commit(session):
+    """事务提交后更新数据版本号"""
+    session.info.pop('data_version_bumped', None)
+    if session.info.pop('cache_dirty', False):
+        result_cache.bump_version()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_dirty_after_rollback(session):
+    session.info.pop('data_version_bumped', None)
+    session.info.pop('cache_dirty', None)
+
+
+def ensure_db_version(conn):
+    """初始化数据库时写入版本号行，避免多个进程第一次写入时同时插入"""
+    exists = conn.execute(
+        select(DataVersions.name).where(DataVersions.name == DATA_VERSION_NAME)
+    ).first()
+    if exists is None:
+        conn.execute(insert(DataVersions).values(name=DATA_VERSION_NAME, version=int(time.time())))
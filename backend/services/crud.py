@@ -1,11 +1,19 @@
-from PIL import Image
-import pytesseract
+# pandas、pytesseract 等较重的模块在函数内按需导入，导入本模块时不加载
+import base64
 import json
 from services.db_manager import DbManager
-import pandas as pd
-from pydantic import BaseModel
+from services.cache import bump_db_version
+from services.player_index import player_name_index, normalize_name
+from services.record_parser import parse_record_strict, RecordParseError
+from models import PlayerCumulativeScores, Players, Games, GameRecords
+from sqlalchemy import text, insert, delete, bindparam, select, Integer, DateTime
+from datetime import datetime, timedelta
+from typing import List
+from pydantic import BaseModel, validator
 
 def booking_record_pic(image_path):
+    from PIL import Image
+    import pytesseract
 
     # 手动标注的区域坐标（示例）——你需要把这些换成你的坐标
     title_box = (150, 120, 200, 160)
@@ -77,101 +85,634 @@ def booking_record_pic(image_path):
     print(json.dumps(result, indent=2, ensure_ascii=False))
 
 
-def get_player_record_data():
-    try:
-        sql1 = 'select * from langhuo_db.game_records'
-        sql2 = 'select * from langhuo_db.players'
-        sql3 = 'select * from langhuo_db.games'
-        
-        db_manager = DbManager()
-        conn = db_manager.get_conn()
-        
-        game_record_data = pd.read_sql(sql1, conn)
-        players_data = pd.read_sql(sql2, conn)
-        games_data = pd.read_sql(sql3, conn)
-        
-        data = pd.merge(
-            game_record_data,
-            players_data,
-            left_on='player_id',
-            right_on='id',
-            how='left'
+# 玩家记录查询的列及类型
+PLAYER_RECORD_DTYPES = {
+    'game_id': 'int32',
+    'player_id': 'int32',
+    'hands_count': 'int32',
+    'buy_in_count': 'int32',
+    'score': 'int32',
+    'player_name': 'category',
+    'game_name': 'category',
+}
+
+
+def build_player_record_query(since=None, until=None, player_ids=None, player_names=None, game_name=None):
+    """构建在数据库中完成三表关联的玩家记录查询，只取需要的列
+
+    since/until: 按牌局开始时间过滤的闭区间
+    player_ids/player_names: 只返回指定玩家的记录
+    game_name: 只返回指定名称的牌局
+    """
+    conditions = []
+    params = {}
+    expanding = []
+    if since is not None:
+        conditions.append('g.start_time >= :since')
+        params['since'] = since
+    if until is not None:
+        conditions.append('g.start_time <= :until')
+        params['until'] = until
+    if player_ids:
+        conditions.append('gr.player_id in :player_ids')
+        params['player_ids'] = list(player_ids)
+        expanding.append('player_ids')
+    if player_names:
+        conditions.append('p.name in :player_names')
+        params['player_names'] = list(player_names)
+        expanding.append('player_names')
+    if game_name is not None:
+        conditions.append('g.name = :game_name')
+        params['game_name'] = game_name
+
+    where_clause = f"where {' and '.join(conditions)}" if conditions else ''
+    sql = f"""
+        select gr.game_id, gr.player_id, gr.hands_count, gr.buy_in_count, gr.score,
+               p.name as player_name, g.name as game_name, g.start_time, g.end_time
+        from langhuo_db.game_records gr
+        join langhuo_db.players p on p.id = gr.player_id
+        join langhuo_db.games g on g.id = gr.game_id
+        {where_clause}
+        order by g.start_time, gr.game_id, gr.id
+    """
+    stmt = text(sql)
+    if expanding:
+        stmt = stmt.bindparams(*[bindparam(name, expanding=True) for name in expanding])
+    return stmt, params
+
+
+def read_player_record_data(conn, **filters):
+    """读取玩家记录并转换列类型，出错时直接抛出异常"""
+    import pandas as pd
+    stmt, params = build_player_record_query(**filters)
+    data = pd.read_sql(stmt, conn, params=params, parse_dates=['start_time', 'end_time'])
+    return data.astype(PLAYER_RECORD_DTYPES)
+
+
+def build_player_cumsum_frame(data, player_ids=None, seed=None):
+    """向量化构建 玩家×牌局 的完整网格，并计算每个玩家的累计score
+
+    player_ids: 参与网格的玩家ID，默认取 data 中出现过的玩家
+    seed: 以 player_id 为索引的 Series，作为各玩家累计分数的起始值
+    """
+    import pandas as pd
+    # 每局每位玩家只取第一条记录
+    records = data.drop_duplicates(['game_id', 'player_id'])
+
+    # 获取所有玩家ID、所有游戏ID和对应的开始时间
+    all_player_ids = data['player_id'].unique() if player_ids is None else player_ids
+    games_info = data[['game_id', 'start_time']].drop_duplicates('game_id')
+
+    # 一次性构建 玩家×牌局 的 MultiIndex，未参与的牌局补空记录
+    grid_index = pd.MultiIndex.from_product(
+        [all_player_ids, games_info['game_id']],
+        names=['player_id', 'game_id']
+    )
+    complete_df = records.set_index(['player_id', 'game_id']).reindex(grid_index)
+
+    # 没有参与，score设为0；开始时间按牌局补齐
+    complete_df['score'] = complete_df['score'].fillna(0).astype(data['score'].dtype)
+    complete_df = complete_df.reset_index()
+    complete_df['start_time'] = complete_df['game_id'].map(
+        games_info.set_index('game_id')['start_time']
+    )
+
+    # 按照player_id和start_time排序（稳定排序，同一时间的牌局保持原有顺序）
+    complete_df = complete_df.sort_values(['player_id', 'start_time'], kind='stable')
+
+    # 计算每个玩家的累计score
+    complete_df['cumulative_score'] = (
+        complete_df.groupby('player_id', sort=False)['score'].cumsum().astype('int64')
+    )
+    if seed is not None:
+        complete_df['cumulative_score'] += (
+            complete_df['player_id'].map(seed).fillna(0).astype('int64')
         )
-        data = pd.merge(
-            data,
-            games_data,
-            left_on='game_id',
-            right_on='id',
-            how='left'
+
+    return complete_df.reset_index(drop=True)
+
+
+def _build_player_cumsum_frame_legacy(data):
+    """逐局逐玩家构建累计分数（旧实现，仅用于对比校验）"""
+    import pandas as pd
+    # 获取所有玩家ID
+    all_player_ids = data['player_id'].unique()
+
+    # 获取所有游戏ID和对应的开始时间
+    games_info = data[['game_id', 'start_time']].drop_duplicates()
+
+    # 创建完整的数据框，包含所有玩家在所有游戏中的记录
+    complete_data = []
+
+    for _, game_row in games_info.iterrows():
+        game_id = game_row['game_id']
+        start_time = game_row['start_time']
+
+        # 获取该局游戏的实际参与者
+        game_participants = data[data['game_id'] == game_id]
+
+        # 为每个玩家创建记录
+        for player_id in all_player_ids:
+            # 检查该玩家是否参与了这局游戏
+            player_in_game = game_participants[game_participants['player_id'] == player_id]
+
+            if len(player_in_game) > 0:
+                # 玩家参与了游戏，使用原始数据
+                complete_data.append(player_in_game.iloc[0].to_dict())
+            else:
+                # 玩家没有参与游戏，创建默认记录
+                default_record = {
+                    'game_id': game_id,
+                    'player_id': player_id,
+                    'start_time': start_time,
+                    'score': 0,  # 没有参与，score设为0
+                    # 其他字段设为空或默认值
+                    'profit': 0,
+                    'buyin': 0,
+                    'hands': 0
+                }
+                complete_data.append(default_record)
+
+    # 转换为DataFrame
+    complete_df = pd.DataFrame(complete_data)
+
+    # 按照player_id和start_time排序
+    complete_df = complete_df.sort_values(['player_id', 'start_time'])
+
+    # 计算每个玩家的累计score
+    complete_df['cumulative_score'] = complete_df.groupby('player_id')['score'].cumsum()
+
+    return complete_df.reset_index(drop=True)
+
+
+def refresh_player_cumulative_scores(session, start_time=None):
+    """增量刷新玩家累计分数物化表
+
+    新增牌局后调用，只重算开始时间不早于 start_time 的牌局；
+    start_time 为 None 时全量重建。需在写入牌局的同一事务中调用，
+    且事务开始时（任何读取之前）先调用 bump_db_version 加锁：否则并发的刷新会基于各自的快照
+    删除并重写对方刚提交的累计分数。
+    """
+    import pandas as pd
+    conn = session.connection()
+    params = {'start_time': start_time}
+
+    # 物化表还没有 start_time 之前的累计分数（如旧数据库尚未回填）而更早的牌局存在时，
+    # 前缀和无从得出，改为全量重建
+    if start_time is not None and _needs_full_rebuild(conn, params):
+        start_time = None
+        params = {'start_time': None}
+
+    prefix_filter = 'where start_time < :start_time' if start_time is not None else 'where 1 = 0'
+
+    # start_time 之后（含）的牌局记录
+    data = read_player_record_data(conn, since=start_time)
+
+    # 各玩家在 start_time 之前的累计分数（前缀和）作为起始值
+    seed = pd.read_sql(
+        text(f"""
+            select player_id, sum(score) as seed
+            from langhuo_db.player_cumulative_scores
+            {prefix_filter}
+            group by player_id
+        """),
+        conn,
+        params=params
+    )
+    seed = seed.set_index('player_id')['seed'].astype('int64')
+
+    new_player_ids = pd.Index(data['player_id'].unique()).difference(seed.index)
+    all_player_ids = seed.index.union(new_player_ids)
+
+    rows = []
+    # 新玩家需要补齐 start_time 之前各牌局的记录（累计分数为 0）
+    if start_time is not None and len(new_player_ids) > 0:
+        earlier_games = pd.read_sql(
+            text("""
+                select distinct game_id, start_time
+                from langhuo_db.player_cumulative_scores
+                where start_time < :start_time
+            """),
+            conn,
+            params=params,
+            parse_dates=['start_time']
         )
-        
-        conn.close()
-        return data
-    except Exception as e:
-        print(f"获取玩家记录数据失败: {e}")
-        # 返回空数据框
-        return pd.DataFrame()
+        for player_id in new_player_ids:
+            for game in earlier_games.itertuples(index=False):
+                rows.append({
+                    'player_id': int(player_id),
+                    'game_id': int(game.game_id),
+                    'start_time': game.start_time.to_pydatetime(),
+                    'score': 0,
+                    'cumulative_score': 0,
+                })
 
+    if not data.empty:
+        complete_df = build_player_cumsum_frame(data, player_ids=all_player_ids, seed=seed)
+        rows.extend(_cumsum_frame_to_rows(complete_df))
 
-def get_player_cumsum_scores():
+    # 删除需要重算的行后整体写回
+    delete_stmt = delete(PlayerCumulativeScores)
+    if start_time is not None:
+        delete_stmt = delete_stmt.where(PlayerCumulativeScores.start_time >= start_time)
+    session.execute(delete_stmt)
+    if rows:
+        session.execute(insert(PlayerCumulativeScores), rows)
+
+    return len(rows)
+
+
+def _needs_full_rebuild(conn, params):
+    """物化表中没有 start_time 之前的行，但 games 中有更早的牌局"""
+    def exists(sql):
+        stmt = _bind_window_params(text(sql), params)
+        return conn.execute(stmt, params).first() is not None
+
+    if exists('select 1 from langhuo_db.player_cumulative_scores where start_time < :start_time limit 1'):
+        return False
+    return exists('select 1 from langhuo_db.games where start_time < :start_time limit 1')
+
+
+def rebuild_player_cumulative_scores(session):
+    """全量重建玩家累计分数物化表"""
+    bump_db_version(session)
+    return refresh_player_cumulative_scores(session, start_time=None)
+
+
+def cumulative_scores_missing(conn):
+    """物化表为空而已有牌局（旧数据库升级后尚未回填）"""
+    table_empty = conn.execute(
+        text('select 1 from langhuo_db.player_cumulative_scores limit 1')
+    ).first() is None
+    return table_empty and conn.execute(text('select 1 from langhuo_db.games limit 1')).first() is not None
+
+
+def backfill_player_cumulative_scores(session):
+    """物化表需要回填时全量重建，返回写入的行数；不需要回填时返回 None
+
+    加锁后再检查：多个进程同时启动时只有第一个会重建。加锁前不要在同一事务中读取，
+    否则检查看到的是加锁前的快照。
+    """
+    bump_db_version(session)
+    if not cumulative_scores_missing(session.connection()):
+        return None
+    return refresh_player_cumulative_scores(session, start_time=None)
+
+
+def _cumsum_frame_to_rows(complete_df):
+    """把累计分数网格转换为可批量写入的字典列表"""
+    return [
+        {
+            'player_id': int(row.player_id),
+            'game_id': int(row.game_id),
+            'start_time': row.start_time.to_pydatetime(),
+            'score': int(row.score),
+            'cumulative_score': int(row.cumulative_score),
+        }
+        for row in complete_df[
+            ['player_id', 'game_id', 'start_time', 'score', 'cumulative_score']
+        ].itertuples(index=False)
+    ]
+
+
+PLAYER_CUMSUM_COLUMNS = ['player_id', 'player_name', 'game_id', 'start_time', 'score', 'cumulative_score']
+
+
+def encode_cursor(start_time, game_id):
+    """把分页位置 (开始时间, 牌局ID) 编码为游标字符串"""
+    raw = f"{start_time.isoformat()}|{int(game_id)}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (开始时间, 牌局ID)，格式不对时抛出 ValueError"""
     try:
-        data = get_player_record_data()
-        
-        # 如果数据为空，返回空列表
-        if data.empty:
-            return []
-        
-        # 获取所有玩家ID
-        all_player_ids = data['player_id'].unique()
-        
-        # 获取所有游戏ID和对应的开始时间
-        games_info = data[['game_id', 'start_time']].drop_duplicates()
-        
-        # 创建完整的数据框，包含所有玩家在所有游戏中的记录
-        complete_data = []
-        
-        for _, game_row in games_info.iterrows():
-            game_id = game_row['game_id']
-            start_time = game_row['start_time']
-            
-            # 获取该局游戏的实际参与者
-            game_participants = data[data['game_id'] == game_id]
-            
-            # 为每个玩家创建记录
-            for player_id in all_player_ids:
-                # 检查该玩家是否参与了这局游戏
-                player_in_game = game_participants[game_participants['player_id'] == player_id]
-                
-                if len(player_in_game) > 0:
-                    # 玩家参与了游戏，使用原始数据
-                    complete_data.append(player_in_game.iloc[0].to_dict())
-                else:
-                    # 玩家没有参与游戏，创建默认记录
-                    default_record = {
-                        'game_id': game_id,
-                        'player_id': player_id,
-                        'start_time': start_time,
-                        'score': 0,  # 没有参与，score设为0
-                        # 其他字段设为空或默认值
-                        'profit': 0,
-                        'buyin': 0,
-                        'hands': 0
-                    }
-                    complete_data.append(default_record)
-        
-        # 转换为DataFrame
-        complete_df = pd.DataFrame(complete_data)
-        
-        # 按照player_id和start_time排序
-        complete_df = complete_df.sort_values(['player_id', 'start_time'])
-        
-        # 计算每个玩家的累计score
-        complete_df['cumulative_score'] = complete_df.groupby('player_id')['score'].cumsum()
-        
-        return complete_df.to_dict(orient='records')
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        start_time, game_id = raw.split('|')
+        return datetime.fromisoformat(start_time), int(game_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"无效的游标: {cursor!r}") from e
+
+
+def _window_conditions(alias, id_column, since, until, bounds):
+    """按牌局 (start_time, id) 顺序构建时间窗口和键集分页条件
+
+    bounds: [(参数名, 比较符, (开始时间, 牌局ID))]，比较符为 '>'、'>=' 或 '<='
+    先按 start_time 范围过滤以便使用索引，再用牌局ID区分同一时间的牌局。
+    """
+    conditions = []
+    if since is not None:
+        conditions.append(f'{alias}.start_time >= :since')
+    if until is not None:
+        conditions.append(f'{alias}.start_time <= :until')
+    for name, op, _ in bounds:
+        if op.startswith('>'):
+            conditions.append(
+                f'{alias}.start_time >= :{name}_time and '
+                f'({alias}.start_time > :{name}_time or {alias}.{id_column} {op} :{name}_id)'
+            )
+        else:
+            conditions.append(
+                f'{alias}.start_time <= :{name}_time and '
+                f'({alias}.start_time < :{name}_time or {alias}.{id_column} {op} :{name}_id)'
+            )
+    return conditions
+
+
+def _bind_window_params(stmt, params):
+    """时间参数按 DateTime 绑定，与列类型保持一致的比较方式"""
+    time_params = [name for name in params if name in ('since', 'until') or name.endswith('_time')]
+    return stmt.bindparams(*[bindparam(name, type_=DateTime) for name in time_params])
+
+
+def _window_params(since, until, bounds):
+    params = {}
+    if since is not None:
+        params['since'] = since
+    if until is not None:
+        params['until'] = until
+    for name, _, (start_time, game_id) in bounds:
+        params[f'{name}_time'] = start_time
+        params[f'{name}_id'] = game_id
+    return params
+
+
+def build_window_games_query(since, until, bounds, order, row_limit):
+    """构建按 (start_time, id) 顺序取窗口内牌局的查询，order 为 'asc' 或 'desc'"""
+    conditions = _window_conditions('g', 'id', since, until, bounds)
+    where_clause = f"where {' and '.join(conditions)}" if conditions else ''
+    sql = f"""
+        select g.id, g.start_time from langhuo_db.games g
+        {where_clause}
+        order by g.start_time {order}, g.id {order}
+        limit :row_limit
+    """
+    params = _window_params(since, until, bounds)
+    params['row_limit'] = row_limit
+    stmt = _bind_window_params(text(sql), params).columns(id=Integer, start_time=DateTime)
+    return stmt, params
+
+
+def build_player_cumsum_query(since=None, until=None, bounds=(), player_ids=None, player_names=None):
+    """构建从物化表读取窗口内玩家累计分数的查询"""
+    conditions = _window_conditions('pcs', 'game_id', since, until, bounds)
+    params = _window_params(since, until, bounds)
+    expanding = []
+    if player_ids:
+        conditions.append('pcs.player_id in :player_ids')
+        params['player_ids'] = list(player_ids)
+        expanding.append('player_ids')
+    if player_names:
+        conditions.append('p.name in :player_names')
+        params['player_names'] = list(player_names)
+        expanding.append('player_names')
+
+    where_clause = f"where {' and '.join(conditions)}" if conditions else ''
+    sql = f"""
+        select pcs.player_id, p.name as player_name, pcs.game_id,
+               pcs.start_time, pcs.score, pcs.cumulative_score
+        from langhuo_db.player_cumulative_scores pcs
+        join langhuo_db.players p on p.id = pcs.player_id
+        {where_clause}
+        order by pcs.player_id, pcs.start_time, pcs.game_id
+    """
+    stmt = _bind_window_params(text(sql), params)
+    if expanding:
+        stmt = stmt.bindparams(*[bindparam(name, expanding=True) for name in expanding])
+    return stmt, params
+
+
+def read_player_cumsum_window(conn, since=None, until=None, player_ids=None, player_names=None,
+                              last_games=None, limit=None, after=None):
+    """从物化表读取一个时间窗口内的玩家累计分数，出错时直接抛出异常
+
+    since/until: 按牌局开始时间过滤的闭区间
+    player_ids/player_names: 只返回指定玩家的记录
+    last_games: 只取窗口内最近的 N 局
+    limit/after: 每页最多 limit 局，after 为 decode_cursor 解析出的上一页最后一局
+    cumulative_score 是物化表中从第一局起的前缀和，窗口和分页边界处的累计分数不需要重新计算。
+    返回 {'frame', 'games_count', 'has_more', 'next_cursor'}，frame 按玩家、牌局排序。
+    """
+    import pandas as pd
+    bounds = []
+
+    def select_games(order, row_limit):
+        stmt, params = build_window_games_query(since, until, bounds, order, row_limit)
+        return conn.execute(stmt, params).all()
+
+    empty = {
+        'frame': pd.DataFrame(columns=PLAYER_CUMSUM_COLUMNS),
+        'games_count': 0,
+        'has_more': False,
+        'next_cursor': None
+    }
+
+    # 最近 N 局：倒序取第 N 局作为窗口起点
+    if last_games:
+        games = select_games('desc', last_games)
+        if not games:
+            return empty
+        bounds.append(('first', '>=', (games[-1].start_time, games[-1].id)))
+    if after:
+        bounds.append(('after', '>', after))
+
+    # 分页：多取一局判断是否还有下一页，本页最后一局作为窗口终点
+    has_more = False
+    next_cursor = None
+    games_count = None
+    if limit:
+        games = select_games('asc', limit + 1)
+        has_more = len(games) > limit
+        games = games[:limit]
+        if not games:
+            return empty
+        last = games[-1]
+        bounds.append(('last', '<=', (last.start_time, last.id)))
+        games_count = len(games)
+        if has_more:
+            next_cursor = encode_cursor(last.start_time, last.id)
+
+    stmt, params = build_player_cumsum_query(since, until, bounds, player_ids, player_names)
+    complete_df = pd.read_sql(stmt, conn, params=params, parse_dates=['start_time'])
+
+    return {
+        'frame': complete_df,
+        'games_count': int(complete_df['game_id'].nunique()) if games_count is None else games_count,
+        'has_more': has_more,
+        'next_cursor': next_cursor,
+    }
+
+
+def build_columnar_scores(complete_df):
+    """把 (玩家, 牌局) 行转换为列式结构：牌局轴、玩家轴和每位玩家按牌局顺序的累计分数数组"""
+    games = complete_df[['game_id', 'start_time']].drop_duplicates('game_id').sort_values(['start_time', 'game_id'])
+    players = complete_df[['player_id', 'player_name']].drop_duplicates('player_id').sort_values('player_id')
+    grid = complete_df.pivot(index='player_id', columns='game_id', values='cumulative_score').reindex(
+        index=players['player_id'], columns=games['game_id']
+    )
+    # 物化表是完整的网格，个别缺失的位置沿用该玩家上一局的累计分数
+    grid = grid.ffill(axis=1).fillna(0).astype('int64')
+    return {
+        'games': {
+            'game_id': games['game_id'].astype('int64').tolist(),
+            'start_time': games['start_time'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist(),
+        },
+        'players': {
+            'player_id': players['player_id'].astype('int64').tolist(),
+            'player_name': players['player_name'].tolist(),
+        },
+        'cumulative_score': grid.to_numpy().tolist(),
+    }
+
+
+def get_player_cumsum_scores(columnar=False, **filters):
+    """从物化表读取玩家累计分数，过滤参数同 read_player_cumsum_window
+
+    columnar 为 False 时 data 为逐行记录列表，为 True 时为 build_columnar_scores 的列式结构。
+    返回 {'data', 'games_count', 'has_more', 'next_cursor'}。
+    """
+    import pandas as pd
+    try:
+        with DbManager().get_conn() as conn:
+            page = read_player_cumsum_window(conn, **filters)
     except Exception as e:
         print(f"计算玩家累计分数失败: {e}")
-        return []
+        page = {
+            'frame': pd.DataFrame(columns=PLAYER_CUMSUM_COLUMNS),
+            'games_count': 0,
+            'has_more': False,
+            'next_cursor': None
+        }
+
+    complete_df = page.pop('frame')
+    if columnar:
+        complete_df = complete_df.astype({'start_time': 'datetime64[ns]'})
+        page['data'] = build_columnar_scores(complete_df)
+    else:
+        page['data'] = complete_df.to_dict(orient='records')
+    return page
+
+
+# 主要访问路径及其应使用的索引
+def _explain_cases():
+    """用实际的查询构建函数生成要检查的查询
+
+    返回 {名称: (stmt, params, {表别名: 预期索引})}，时间参数取最近一段时间，
+    玩家参数取 ID 为 1 的玩家。
+    """
+    until = datetime.now()
+    since = until - timedelta(days=365)
+    page_bound = [('last', '<=', (until, 1))]
+    return {
+        'player_record_window': (
+            *build_player_record_query(since=since, until=until),
+            {'g': 'ix_games_start_time_id', 'gr': 'ix_game_records_game', 'p': 'PRIMARY'},
+        ),
+        'player_record_players': (
+            *build_player_record_query(player_ids=[1]),
+            {'gr': 'ix_game_records_player_game', 'g': 'PRIMARY', 'p': 'PRIMARY'},
+        ),
+        'cumsum_games_page': (
+            *build_window_games_query(since, until, [], 'asc', 201),
+            {'g': 'ix_games_start_time_id'},
+        ),
+        'cumsum_last_games': (
+            *build_window_games_query(None, None, [], 'desc', 50),
+            {'g': 'ix_games_start_time_id'},
+        ),
+        'cumsum_window': (
+            *build_player_cumsum_query(since, until, page_bound),
+            {'pcs': 'ix_player_cumulative_scores_start', 'p': 'PRIMARY'},
+        ),
+        'cumsum_players': (
+            *build_player_cumsum_query(since, until, page_bound, player_ids=[1]),
+            {'pcs': 'ix_player_cumulative_scores_player_start', 'p': 'PRIMARY'},
+        ),
+    }
+
+
+# 全表扫描和全索引扫描
+FULL_SCAN_TYPES = {'ALL', 'index'}
+
+
+def explain_query(conn, stmt, params=None):
+    """对查询执行 EXPLAIN 并返回执行计划的行
+
+    在发送给驱动前给语句加上 explain 前缀，展开参数和类型绑定与实际执行完全一致。
+    """
+    from sqlalchemy import event
+
+    def add_explain(conn, cursor, statement, parameters, context, executemany):
+        return f"explain {statement}", parameters
+
+    event.listen(conn, 'before_cursor_execute', add_explain, retval=True)
+    try:
+        return conn.execute(stmt, params or {}).mappings().all()
+    finally:
+        event.remove(conn, 'before_cursor_execute', add_explain)
+
+
+def t_explain_index_usage():
+    """用 EXPLAIN 检查接口实际发出的查询是否使用了预期的索引（需要连接有数据的 MySQL）"""
+    db_manager = DbManager()
+    failed = []
+    with db_manager.get_conn() as conn:
+        for name, (stmt, params, expected_keys) in _explain_cases().items():
+            plan = explain_query(conn, stmt, params)
+            problems = []
+            for row in plan:
+                table, key, access_type = row['table'], row['key'], row['type']
+                if access_type in FULL_SCAN_TYPES:
+                    problems.append(f"{table} type={access_type}")
+                if table in expected_keys and key != expected_keys[table]:
+                    problems.append(f"{table} key={key} 预期 {expected_keys[table]}")
+            status = '❌' if problems else '✅'
+            print(f"{status} {name}: " + ', '.join(
+                f"{row['table']}({row['type']}, {row['key']})" for row in plan
+            ))
+            if problems:
+                failed.append(f"{name}: {'; '.join(problems)}")
+
+    assert not failed, f"未使用预期索引: {failed}"
+
+
+def t_compare_cumsum_engines(games_count=60, players_count=12, seed=0):
+    """用合成数据对比向量化实现与旧实现的结果是否一致"""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for game_id in range(1, games_count + 1):
+        # 故意制造开始时间相同的牌局
+        start_time = pd.Timestamp('2025-01-01') + pd.Timedelta(hours=int(game_id // 3))
+        participants = rng.choice(
+            np.arange(1, players_count + 1),
+            size=int(rng.integers(2, players_count + 1)),
+            replace=False
+        )
+        for player_id in participants:
+            rows.append({
+                'game_id': game_id,
+                'player_id': int(player_id),
+                'hands_count': int(rng.integers(10, 500)),
+                'buy_in_count': int(rng.integers(1, 5)),
+                'score': int(rng.integers(-5000, 5000)),
+                'player_name': f'player_{player_id}',
+                'start_time': start_time,
+            })
+    data = pd.DataFrame(rows).astype({'player_name': 'category'})
+
+    expected = _build_player_cumsum_frame_legacy(data)
+    actual = build_player_cumsum_frame(data)
+
+    columns = [c for c in expected.columns if c in actual.columns]
+    pd.testing.assert_frame_equal(
+        actual[columns].astype(object),
+        expected[columns].astype(object),
+        check_dtype=False
+    )
+    print(f"✅ 结果一致: {len(actual)} 行, {games_count} 局, {players_count} 名玩家")
 
 
 class PlayerRecordCreate(BaseModel):
@@ -186,3 +727,196 @@ class PlayerRecordCreate(BaseModel):
         return v
 
 
+class GameRecordBooking(BaseModel):
+    player_name: str
+    hands_count: int
+    buy_in_count: int
+    score: int
+
+    @validator('score')
+    def validate_score(cls, v):
+        if v < -1000000 or v > 1000000:
+            raise ValueError('分数超出合理范围')
+        return v
+
+
+class GameBooking(BaseModel):
+    game_name: str
+    sb: int
+    bb: int
+    game_hands_count: int
+    creator_player_name: str
+    start_time: datetime
+    end_time: datetime
+    record_list: List[GameRecordBooking]
+
+    @validator('record_list')
+    def validate_record_list(cls, v):
+        if not v:
+            raise ValueError('牌局没有玩家记录')
+        return v
+
+
+def parse_game_booking(game, reference_time=None):
+    """把识别结果解析并校验为 GameBooking，解析失败时抛出 RecordParseError"""
+    return GameBooking(**parse_record_strict(game, reference_time))
+
+
+def resolve_player_ids(session, names, fuzzy=False, name_index=player_name_index):
+    """批量把玩家名转换为 Players.id
+
+    先按名字精确查找：内存中的玩家名索引，再批量查库（其他进程可能已经插入）。
+    fuzzy 为 True 时（名字直接来自 OCR），仍找不到的名字再用索引模糊匹配，
+    容忍少量识别错误；最后仍不存在的玩家一次性插入。
+    """
+    names = set(names)
+    if not names:
+        return {}
+
+    name_index.ensure_loaded(session)
+    player_ids = {}
+    for name in names:
+        player_id = name_index.get(name)
+        if player_id is not None:
+            player_ids[name] = player_id
+
+    unresolved = names - player_ids.keys()
+    if unresolved:
+        stmt = select(Players.name, Players.id).where(Players.name.in_(unresolved))
+        for name, player_id in session.execute(stmt).all():
+            name_index.add(name, player_id)
+            player_ids[name] = player_id
+        # 库中的名字和请求中的名字可能只有大小写、全半角的差别
+        for name in unresolved - player_ids.keys():
+            player_id = name_index.get(name)
+            if player_id is not None:
+                player_ids[name] = player_id
+
+    unresolved = names - player_ids.keys()
+    if unresolved and fuzzy:
+        for name in unresolved:
+            matched = name_index.match(name)
+            if matched is not None:
+                print(f"玩家名 {name!r} 模糊匹配为 {matched[1]!r}（编辑距离 {matched[2]}）")
+                player_ids[name] = matched[0]
+
+    missing = names - player_ids.keys()
+    if missing:
+        session.execute(insert(Players), [{'name': name} for name in sorted(missing)])
+        stmt = select(Players.name, Players.id).where(Players.name.in_(missing))
+        # 本事务新插入的玩家等提交后再加入索引，回滚时不会在索引里留下不存在的玩家ID
+        for name, player_id in session.execute(stmt).all():
+            name_index.add_after_commit(session, name, player_id)
+            player_ids[name] = player_id
+
+    return player_ids
+
+
+def check_distinct_players(games, player_ids, positions=None):
+    """同一局中不同的玩家名不能对应同一个玩家，有冲突时抛出 RecordParseError
+
+    positions: 各牌局在原始请求中的下标，用于错误信息，默认按 games 的顺序编号
+    """
+    errors = []
+    for i, game in zip(positions or range(len(games)), games):
+        seen = {}
+        for record in game.record_list:
+            player_id = player_ids[record.player_name]
+            if player_id in seen and seen[player_id] != record.player_name:
+                errors.append(
+                    f"games[{i}]: 玩家 {seen[player_id]} 和 {record.player_name} 对应同一玩家ID {player_id}"
+                )
+            seen.setdefault(player_id, record.player_name)
+    if errors:
+        raise RecordParseError(errors)
+
+
+def game_booking_key(game):
+    """牌局的自然键 (开始时间, 牌局名, 创建者名)，用于识别重复登记"""
+    return game.start_time, normalize_name(game.game_name), normalize_name(game.creator_player_name)
+
+
+def find_booked_game_keys(session, games):
+    """返回 games 中已经登记过的牌局的自然键集合"""
+    start_times = {game.start_time for game in games}
+    if not start_times:
+        return set()
+    rows = session.execute(
+        select(Games.start_time, Games.name, Players.name)
+        .join(Players, Players.id == Games.creator_id)
+        .where(Games.start_time.in_(start_times))
+    ).all()
+    return {
+        (start_time, normalize_name(game_name), normalize_name(creator_name))
+        for start_time, game_name, creator_name in rows
+    }
+
+
+def book_games(session, games, fuzzy_names=False):
+    """在同一事务中批量写入牌局及玩家记录，返回 (新牌局的ID, 跳过的牌局自然键)
+
+    games: GameBooking 列表。调用方负责提交或回滚事务。
+    fuzzy_names: 玩家名直接来自 OCR 时为 True，允许模糊匹配已有玩家
+    已经登记过或在 games 中重复出现的牌局（见 game_booking_key）不再写入。
+    同一局中两条记录对应同一玩家时抛出 RecordParseError。
+    """
+    if not games:
+        return [], []
+
+    # 先锁住版本号行，同时只有一个事务写入牌局并刷新累计分数，
+    # 之后的重复登记检查不会和其他事务的写入交错
+    bump_db_version(session)
+
+    booked_keys = find_booked_game_keys(session, games)
+    positions = []
+    new_games = []
+    skipped = []
+    for i, game in enumerate(games):
+        key = game_booking_key(game)
+        if key in booked_keys:
+            skipped.append(key)
+            continue
+        booked_keys.add(key)
+        positions.append(i)
+        new_games.append(game)
+    games = new_games
+    if not games:
+        return [], skipped
+
+    names = {game.creator_player_name for game in games}
+    names.update(record.player_name for game in games for record in game.record_list)
+    player_ids = resolve_player_ids(session, names, fuzzy=fuzzy_names)
+    check_distinct_players(games, player_ids, positions)
+
+    game_rows = [
+        Games(
+            name=game.game_name,
+            start_time=game.start_time,
+            end_time=game.end_time,
+            sb=game.sb,
+            bb=game.bb,
+            hands_count=game.game_hands_count,
+            creator_id=player_ids[game.creator_player_name],
+        )
+        for game in games
+    ]
+    session.add_all(game_rows)
+    session.flush()
+
+    record_rows = [
+        {
+            'game_id': game_row.id,
+            'player_id': player_ids[record.player_name],
+            'hands_count': record.hands_count,
+            'buy_in_count': record.buy_in_count,
+            'score': record.score,
+        }
+        for game, game_row in zip(games, game_rows)
+        for record in game.record_list
+    ]
+    session.execute(insert(GameRecords), record_rows)
+
+    # 只重算最早一局之后的累计分数
+    refresh_player_cumulative_scores(session, min(game.start_time for game in games))
+
+    return [game_row.id for game_row in game_rows], skipped
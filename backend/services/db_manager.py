@@ -1,16 +1,22 @@
 # 初始化数据库
 # 使用 mysql sqlalchemy
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, text   
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, text, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool, NullPool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from datetime import datetime
 from flask import current_app
 from werkzeug.utils import secure_filename
 from models import Base
 import os
+import threading
+import time
 import logging
 from dotenv import load_dotenv
 from .mysql_service import MySQLServiceManager
+# 注册写入后递增数据版本号的会话事件，批量导入等不经过 app 的进程同样生效
+from . import cache
 
 # 加载环境变量
 load_dotenv()
@@ -18,40 +24,134 @@ load_dotenv()
 # 配置日志
 logger = logging.getLogger(__name__)
 
+class TimedQueuePool(QueuePool):
+    """记录取连接耗时（含排队等待和新建连接）的连接池"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeout_count = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeout_count += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_count += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+# 进程内共享的引擎和会话工厂，按数据库URL区分，每个进程（worker）只建一次连接池
+_engines = {}
+_session_factories = {}
+_scoped_sessions = {}
+_registry_lock = threading.Lock()
+
+
+def get_engine(url):
+    """获取共享引擎，首次调用时按 DB_POOL_* 配置创建连接池"""
+    engine = _engines.get(url)
+    if engine is None:
+        with _registry_lock:
+            engine = _engines.get(url)
+            if engine is None:
+                engine = create_engine(
+                    url,
+                    poolclass=TimedQueuePool,
+                    pool_size=int(os.getenv('DB_POOL_SIZE', 10)),
+                    max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 20)),
+                    pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', 30)),
+                    pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 3600)),
+                    echo=os.getenv('DB_ECHO', 'false').lower() == 'true'
+                )
+                _engines[url] = engine
+                _session_factories[url] = sessionmaker(bind=engine)
+                _scoped_sessions[url] = scoped_session(_session_factories[url])
+                logger.info(f"创建数据库引擎: {engine.url!r}")
+    return engine
+
+
+def get_session_factory(url):
+    get_engine(url)
+    return _session_factories[url]
+
+
+def get_scoped_session(url):
+    get_engine(url)
+    return _scoped_sessions[url]
+
+
+def pool_stats():
+    """各共享引擎的连接池状态"""
+    stats = []
+    for engine in list(_engines.values()):
+        pool = engine.pool
+        stats.append({
+            'url': repr(engine.url),
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+            'wait_count': pool.wait_count,
+            'avg_wait_ms': round(pool.wait_seconds / (pool.wait_count or 1) * 1000, 3),
+            'max_wait_ms': round(pool.max_wait_seconds * 1000, 3),
+            'timeout_count': pool.timeout_count,
+        })
+    return stats
+
+
+def dispose_engines(close=True):
+    """释放所有连接池
+
+    close=False 供 fork 出的子进程使用：只丢弃从父进程继承的连接和会话，不关闭它们，
+    避免影响父进程仍在使用的连接，子进程之后按需新建自己的连接。
+    """
+    with _registry_lock:
+        for url, engine in _engines.items():
+            if close:
+                _scoped_sessions[url].remove()
+            else:
+                _scoped_sessions[url] = scoped_session(_session_factories[url])
+            engine.dispose(close=close)
+
+
 class DbManager:
     def __init__(self, app=None):
         self.mysql_manager = MySQLServiceManager()
+        self.db_url = self._get_database_url()
+        self.db_url_without_db = self._get_database_url(with_db=False)
+        self._schema_ready = False
+        self._schema_retry_at = 0.0
+        self._schema_lock = threading.Lock()
         if app is not None:
             self.init_app(app)
-    
+
+    # 引擎和会话工厂来自进程内共享的注册表，第一次访问数据库时才创建，
+    # 创建多个 DbManager 不会新建连接池
+    @property
+    def engine(self):
+        return get_engine(self.db_url)
+
+    @property
+    def session_factory(self):
+        return get_session_factory(self.db_url)
+
+    @property
+    def Session(self):
+        return get_scoped_session(self.db_url)
+
     def init_app(self, app):
-        """初始化数据库连接"""
-        # 从环境变量或配置文件获取数据库配置
-        self.db_url = self._get_database_url()
-        self.db_url_without_db = self._get_database_url(with_db=False)
-        
-        # 创建引擎，包含连接池配置
-        self.engine = create_engine(
-            self.db_url,
-            pool_size=int(os.getenv('DB_POOL_SIZE', 10)),
-            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 20)),
-            pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', 30)),
-            pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 3600)),
-            echo=os.getenv('DB_ECHO', 'false').lower() == 'true'
-        )
-        self.engine_without_db = create_engine(
-            self.db_url_without_db,
-            pool_size=int(os.getenv('DB_POOL_SIZE', 10)),
-            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 20)),
-            pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', 30)),
-            pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 3600)),
-            echo=os.getenv('DB_ECHO', 'false').lower() == 'true'
-        )
-        
-        # 创建会话工厂
-        self.session_factory = sessionmaker(bind=self.engine)
-        self.Session = scoped_session(self.session_factory)
-    
+        """请求结束时归还当前线程的会话"""
+        app.teardown_appcontext(lambda exc: self.Session.remove())
+
     def _get_database_url(self, with_db=True):
         """获取数据库连接URL"""
         # 优先使用环境变量
@@ -78,22 +178,98 @@ class DbManager:
             # 获取数据库名称
             database = os.getenv('DATABASE_NAME', 'langhuo_db')
             
-            # 创建数据库
-            with self.engine_without_db.connect() as conn:
-                conn.execute(text(f"CREATE DATABASE IF NOT EXISTS {database}"))
-                conn.commit()
+            # 创建数据库，只在初始化时用一次，不保留连接池
+            engine_without_db = create_engine(self.db_url_without_db, poolclass=NullPool)
+            try:
+                with engine_without_db.connect() as conn:
+                    conn.execute(text(f"CREATE DATABASE IF NOT EXISTS {database}"))
+                    conn.commit()
+            finally:
+                engine_without_db.dispose()
 
             # 创建表
             Base.metadata.create_all(self.engine)
+            with self.engine.begin() as conn:
+                cache.ensure_db_version(conn)
             print("数据库表初始化完成")
+
+            # 已有的表补建索引
+            created = self.ensure_indexes()
+            if created:
+                print(f"补建索引: {', '.join(created)}")
+
+            # 已有数据库首次升级时回填玩家累计分数物化表
+            rows_count = self.ensure_cumulative_scores()
+            if rows_count is not None:
+                print(f"玩家累计分数表已回填: {rows_count} 行")
         except Exception as e:
             logger.error(f"初始化数据库失败: {e}")
             raise
 
+    def ensure_schema(self):
+        """不经过 init_db 启动时（python app.py、gunicorn）补建缺少的表和索引并回填物化表"""
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            cache.ensure_db_version(conn)
+        self.ensure_indexes()
+        self.ensure_cumulative_scores()
+
+    def ensure_schema_once(self, retry_interval=30):
+        """每个进程成功执行一次 ensure_schema，失败后至少间隔 retry_interval 秒再重试"""
+        with self._schema_lock:
+            if self._schema_ready or time.monotonic() < self._schema_retry_at:
+                return
+            self._schema_retry_at = time.monotonic() + retry_interval
+            try:
+                self.ensure_schema()
+                self._schema_ready = True
+            except Exception as e:
+                logger.error(f"检查数据库表结构失败: {e}")
+
+    def ensure_cumulative_scores(self):
+        """玩家累计分数物化表为空而已有牌局时全量重建，返回写入的行数，不需要时返回 None"""
+        from services.crud import cumulative_scores_missing, backfill_player_cumulative_scores
+
+        # 先用独立连接无锁检查，绝大多数启动不需要加锁
+        with self.get_conn() as conn:
+            if not cumulative_scores_missing(conn):
+                return None
+        session = self.new_session()
+        try:
+            rows_count = backfill_player_cumulative_scores(session)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if rows_count is not None:
+            logger.info(f"玩家累计分数表已回填: {rows_count} 行")
+        return rows_count
+
+    def ensure_indexes(self):
+        """为已有数据库补建 models 中声明但尚未存在的索引"""
+        created = []
+        inspector = inspect(self.engine)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name, schema=table.schema):
+                continue
+            existing = {ix['name'] for ix in inspector.get_indexes(table.name, schema=table.schema)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    logger.info(f"创建索引 {table.name}.{index.name}")
+                    index.create(self.engine)
+                    created.append(index.name)
+        return created
+
     def get_session(self):
         """获取数据库会话"""
         return self.Session()
 
+    def new_session(self):
+        """获取不绑定当前线程的独立会话，由调用方负责关闭"""
+        return self.session_factory()
+
     def close_session(self):
         """关闭数据库会话"""
         self.Session.remove()
@@ -116,12 +292,18 @@ class DbManager:
         """确保MySQL服务正在运行"""
         logger.info("检查MySQL服务状态...") 
         
-        # 检查MySQL服务是否正在运行
-        if self.mysql_manager.check_mysql_service():
-            logger.info("MySQL服务正在运行")
+        # 能正常连接就不需要再查询系统服务
+        ready, message = self.mysql_manager.probe_mysql()
+        if ready:
+            logger.info(f"MySQL服务正在运行: {message}")
             return True
+
+        # 服务已启动但还不能接受连接时，等待其就绪
+        if self.mysql_manager.check_mysql_service():
+            logger.info("MySQL服务正在启动，等待就绪...")
+            return self.mysql_manager.wait_for_mysql_ready(timeout=60)
         
-        logger.warning("MySQL服务未运行，尝试启动...")
+        logger.warning(f"MySQL服务未运行({message})，尝试启动...")
         
         # 尝试启动MySQL服务
         success, message = self.mysql_manager.start_mysql_service()
@@ -151,12 +333,11 @@ class DbManager:
         if '2003' in str(message):
             logger.info(f"MySQL服务未运行: {message}")
             logger.info(f"尝试启动MySQL服务...")
-            success, message = self.ensure_mysql_service_running()
-            if success:
-                logger.info(f"MySQL服务启动成功: {message}")
+            if self.ensure_mysql_service_running():
+                logger.info("MySQL服务已就绪")
                 return self.check_and_start_mysql()
             else:
-                logger.error(f"MySQL服务启动失败: {message}")
+                logger.error("MySQL服务启动失败")
                 return False
         
         if '1049' in str(message):
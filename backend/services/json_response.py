@@ -0,0 +1,72 @@
+# 大结果接口的 JSON 编码和压缩
+# 用 orjson 编码（requirements.txt 中的依赖，缺失时退回标准库 json）；
+# 客户端支持时按 br > gzip 压缩响应体，brotli 为可选依赖
+import gzip
+import json
+import os
+from datetime import date, datetime
+from flask import current_app, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该字节数的响应不压缩
+compress_min_size = int(os.getenv('RESPONSE_COMPRESS_MIN_SIZE', 1024))
+gzip_level = int(os.getenv('RESPONSE_GZIP_LEVEL', 6))
+brotli_quality = int(os.getenv('RESPONSE_BROTLI_QUALITY', 5))
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    # numpy 整数和浮点数
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def dumps(payload):
+    """编码为紧凑的 UTF-8 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(
+        payload, ensure_ascii=False, separators=(',', ':'), default=_json_default
+    ).encode('utf-8')
+
+
+def choose_encoding():
+    """按请求的 Accept-Encoding 选择压缩方式，不压缩时返回 None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """客户端支持时压缩响应体，返回所用的压缩方式"""
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    encoding = choose_encoding()
+    if encoding is None or len(body) < compress_min_size:
+        return None
+    if encoding == 'br':
+        body = brotli.compress(body, quality=brotli_quality)
+    else:
+        body = gzip.compress(body, compresslevel=gzip_level)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return encoding
+
+
+def fast_json_response(payload, status=200):
+    """用 dumps 编码的 JSON 响应"""
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
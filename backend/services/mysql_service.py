@@ -3,6 +3,7 @@ import time
 import platform
 import os
 import logging
+from urllib.parse import urlsplit, unquote
 from typing import Optional, Tuple
 
 # 配置日志
@@ -12,12 +13,64 @@ logger = logging.getLogger(__name__)
 class MySQLServiceManager:
     """MySQL服务管理器"""
     
-    def __init__(self):
+    def __init__(self, host=None, port=None):
         self.system = platform.system().lower()
         self.is_windows = self.system == 'windows'
         self.is_linux = self.system == 'linux'
         self.is_macos = self.system == 'darwin'
-    
+        config = self._get_connect_config()
+        self.host = host or config['host']
+        self.port = int(port or config['port'])
+        self.username = config['username']
+        self.password = config['password']
+
+    @staticmethod
+    def _get_connect_config():
+        """与 DbManager 使用同样的配置：优先 DATABASE_URL，其次 DB_HOST/DB_PORT 等环境变量"""
+        if os.getenv('DATABASE_URL'):
+            url = urlsplit(os.getenv('DATABASE_URL'))
+            return {
+                'host': url.hostname or 'localhost',
+                'port': url.port or 3306,
+                'username': unquote(url.username or 'root'),
+                'password': unquote(url.password or ''),
+            }
+        return {
+            'host': os.getenv('DB_HOST', 'localhost'),
+            'port': os.getenv('DB_PORT', '3306'),
+            'username': os.getenv('DB_USERNAME', 'root'),
+            'password': os.getenv('DB_PASSWORD', '123456'),
+        }
+
+    def probe_mysql(self, timeout: float = 2.0) -> Tuple[bool, str]:
+        """用配置的账号建立一次完整连接并执行查询，判断MySQL是否可用
+
+        完成认证后正常断开（COM_QUIT），不会被服务端计入 max_connect_errors。
+        返回 (是否就绪, 服务端版本或错误信息)。
+        """
+        # pymysql 只在探测时导入，不拖慢应用启动
+        import pymysql
+
+        try:
+            conn = pymysql.connect(
+                host=self.host,
+                port=self.port,
+                user=self.username,
+                password=self.password,
+                connect_timeout=timeout,
+                read_timeout=timeout,
+                write_timeout=timeout
+            )
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT VERSION()')
+                    version = cursor.fetchone()[0]
+            finally:
+                conn.close()
+            return True, version
+        except (pymysql.MySQLError, OSError) as e:
+            return False, f"{self.host}:{self.port} 无法连接: {e}"
+
     def check_mysql_service(self) -> bool:
         """检查MySQL服务是否正在运行"""
         try:
@@ -381,16 +434,36 @@ class MySQLServiceManager:
         except Exception as e:
             return False, f"停止MySQL服务出错: {e}"
     
-    def wait_for_mysql_ready(self, timeout: int = 60) -> bool:
-        """等待MySQL服务就绪"""
-        logger.info("等待MySQL服务就绪...")
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            if self.check_mysql_service():
-                logger.info("MySQL服务已就绪")
+    def wait_for_mysql_ready(self, timeout: float = 60, initial_delay: float = 0.1,
+                             max_delay: float = 2.0, use_service_manager: bool = False) -> bool:
+        """等待MySQL可以接受连接
+
+        以连接探测为准，失败后按指数退避重试，总时长不超过 timeout 秒。
+        use_service_manager 为 True 时，连接探测失败但系统服务显示正在运行也视为就绪，
+        用于只能通过本地 socket 连接等探测不到端口的情况。
+        """
+        logger.info(f"等待MySQL服务就绪({self.host}:{self.port})...")
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+        attempts = 0
+
+        while True:
+            attempts += 1
+            remaining = deadline - time.monotonic()
+            ready, message = self.probe_mysql(timeout=max(min(2.0, remaining), 0.1))
+            if ready:
+                logger.info(f"MySQL服务已就绪: {message}，共探测 {attempts} 次")
                 return True
-            time.sleep(2)
-        
-        logger.error(f"等待MySQL服务就绪超时({timeout}秒)")
-        return False 
\ No newline at end of file
+            if use_service_manager and self.check_mysql_service():
+                logger.warning(f"连接探测失败({message})，按系统服务状态视为就绪")
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            logger.debug(f"MySQL尚未就绪: {message}，{delay:.2f}秒后重试")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+        logger.error(f"等待MySQL服务就绪超时({timeout}秒): {message}")
+        return False
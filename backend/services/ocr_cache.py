@@ -0,0 +1,154 @@
+# OCR 结果缓存
+# tesseract 对同样的像素总是给出同样的结果，以裁剪区域的像素哈希加语言和参数为键缓存到本地 SQLite，
+# 表头标签、常见玩家名等重复区域不再启动 tesseract 子进程
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+default_cache_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ocr_cache.sqlite'
+)
+
+
+class OcrResultCache:
+    """基于 SQLite 的 OCR 结果缓存，超过容量时淘汰最久未使用的条目
+
+    命中时不立即写库：last_access 早于 touch_interval 秒的条目才记入待更新列表，
+    攒够 touch_batch_size 条或下一次写入时一并提交，淘汰只需要近似的访问时间。
+    """
+
+    def __init__(self, path=default_cache_path, max_entries=100000, enabled=True,
+                 touch_interval=3600, touch_batch_size=256):
+        self.path = path
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.touch_interval = touch_interval
+        self.touch_batch_size = touch_batch_size
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._count = 0
+        self._pending_touches = {}
+        self._lock = threading.Lock()
+
+    def _get_conn(self):
+        # 首次使用时才创建数据库文件
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # WAL 模式下 NORMAL 只在检查点时 fsync，断电最多丢失最近的缓存条目
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute("""
+                create table if not exists ocr_cache (
+                    key text primary key,
+                    text text not null,
+                    last_access real not null
+                )
+            """)
+            self._conn.execute('create index if not exists ix_ocr_cache_last_access on ocr_cache (last_access)')
+            self._count = self._conn.execute('select count(*) from ocr_cache').fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def make_key(region, lang, config=''):
+        """以像素内容、尺寸、模式、语言和参数生成缓存键"""
+        digest = hashlib.sha1()
+        digest.update(f"{region.mode}:{region.size}:{lang}:{config}:".encode('utf-8'))
+        digest.update(region.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            conn = self._get_conn()
+            row = conn.execute('select text, last_access from ocr_cache where key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            now = time.time()
+            if now - row[1] > self.touch_interval:
+                self._pending_touches[key] = now
+                if len(self._pending_touches) >= self.touch_batch_size:
+                    self._flush_touches(conn)
+                    conn.commit()
+            return row[0]
+
+    def set(self, key, text):
+        if not self.enabled:
+            return
+        with self._lock:
+            conn = self._get_conn()
+            self._flush_touches(conn)
+            now = time.time()
+            cursor = conn.execute(
+                'insert or ignore into ocr_cache (key, text, last_access) values (?, ?, ?)',
+                (key, text, now)
+            )
+            if cursor.rowcount == 1:
+                self._count += 1
+            else:
+                # 两个线程同时未命中同一区域时，后写入的只更新已有条目，不计入条目数
+                conn.execute(
+                    'update ocr_cache set text = ?, last_access = ? where key = ?',
+                    (text, now, key)
+                )
+            if self._count > self.max_entries:
+                self._evict(conn)
+            conn.commit()
+
+    def _flush_touches(self, conn):
+        """写入待更新的访问时间，由调用方提交"""
+        if self._pending_touches:
+            conn.executemany(
+                'update ocr_cache set last_access = ? where key = ?',
+                [(last_access, key) for key, last_access in self._pending_touches.items()]
+            )
+            self._pending_touches.clear()
+
+    def flush(self):
+        """提交待更新的访问时间"""
+        with self._lock:
+            if self._conn is not None and self._pending_touches:
+                self._flush_touches(self._conn)
+                self._conn.commit()
+
+    def _evict(self, conn):
+        """一次淘汰 10% 最久未使用的条目，避免每次写入都触发淘汰"""
+        target = int(self.max_entries * 0.9)
+        conn.execute("""
+            delete from ocr_cache where key in (
+                select key from ocr_cache order by last_access limit ?
+            )
+        """, (self._count - target,))
+        self._count = conn.execute('select count(*) from ocr_cache').fetchone()[0]
+        logger.info(f"OCR缓存淘汰后剩余 {self._count} 条")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': self._count,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+ocr_cache = OcrResultCache(
+    path=os.getenv('OCR_CACHE_PATH', default_cache_path),
+    max_entries=int(os.getenv('OCR_CACHE_MAX_ENTRIES', 100000)),
+    enabled=os.getenv('OCR_CACHE_ENABLED', 'true').lower() == 'true',
+    touch_interval=int(os.getenv('OCR_CACHE_TOUCH_INTERVAL', 3600))
+)
+# 退出前提交尚未写入的访问时间
+atexit.register(ocr_cache.flush)
@@ -0,0 +1,148 @@
+# OCR 任务队列
+# 上传接口只负责保存图片并登记任务，识别在后台线程池中完成，任务状态持久化到 ocr_jobs 表
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from models import OcrJobs
+from services.record_parser import parse_record
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# 超过该时间仍处于 running 的任务视为所在进程已退出，恢复时重新排队
+job_stale_seconds = int(os.getenv('OCR_JOB_STALE_SECONDS', 600))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化: {type(value)}")
+
+
+class OcrJobManager:
+    """OCR 任务管理器"""
+
+    def __init__(self, session_factory, max_workers=None):
+        self.session_factory = session_factory
+        self.max_workers = max_workers or int(os.getenv('OCR_JOB_WORKERS', 2))
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='ocr-job'
+        )
+        self._recovered = False
+        self._recover_retry_at = 0.0
+        self._recover_lock = threading.Lock()
+
+    def submit(self, pic_path, filename):
+        """登记任务并放入队列，立即返回任务ID"""
+        job_id = uuid.uuid4().hex
+        with self.session_factory() as session, session.begin():
+            session.add(OcrJobs(
+                id=job_id,
+                filename=filename,
+                pic_path=pic_path,
+                status=JOB_QUEUED
+            ))
+        self.executor.submit(self._run, job_id, pic_path)
+        return job_id
+
+    def get_job(self, job_id):
+        """查询任务状态，任务不存在时返回 None"""
+        with self.session_factory() as session:
+            job = session.get(OcrJobs, job_id)
+            if job is None:
+                return None
+            return {
+                'job_id': job.id,
+                'filename': job.filename,
+                'status': job.status,
+                'result': json.loads(job.result) if job.result else None,
+                'error': job.error,
+                'created_at': job.created_at.isoformat() if job.created_at else None,
+                'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+            }
+
+    def recover(self):
+        """服务重启后重新排队未完成的任务
+
+        多个进程可能同时恢复：超时的 running 任务用条件更新改回 queued，
+        真正执行前还要通过 _claim 抢占，同一任务只会有一个进程执行。
+        """
+        cutoff = datetime.now() - timedelta(seconds=job_stale_seconds)
+        with self.session_factory() as session, session.begin():
+            session.query(OcrJobs).filter(
+                OcrJobs.status == JOB_RUNNING,
+                OcrJobs.updated_at < cutoff
+            ).update({'status': JOB_QUEUED, 'updated_at': func.now()}, synchronize_session=False)
+            jobs = session.query(OcrJobs.id, OcrJobs.pic_path).filter(
+                OcrJobs.status == JOB_QUEUED
+            ).all()
+        for job_id, pic_path in jobs:
+            self.executor.submit(self._run, job_id, pic_path)
+        if jobs:
+            logger.info(f"重新排队 {len(jobs)} 个未完成的OCR任务")
+        return len(jobs)
+
+    def recover_once(self, retry_interval=30):
+        """每个进程成功恢复一次，供启动脚本和各 worker 的请求调用
+
+        失败（如数据库暂时不可用）时不标记为已恢复，至少间隔 retry_interval 秒后再重试。
+        """
+        with self._recover_lock:
+            if self._recovered or time.monotonic() < self._recover_retry_at:
+                return 0
+            self._recover_retry_at = time.monotonic() + retry_interval
+            try:
+                recovered = self.recover()
+            except Exception as e:
+                logger.error(f"恢复OCR任务失败: {e}")
+                return 0
+            self._recovered = True
+            return recovered
+
+    def _claim(self, job_id):
+        """把 queued 任务改为 running，返回是否抢到；已被其他进程执行的任务返回 False"""
+        with self.session_factory() as session, session.begin():
+            claimed = session.query(OcrJobs).filter(
+                OcrJobs.id == job_id,
+                OcrJobs.status == JOB_QUEUED
+            ).update({'status': JOB_RUNNING, 'updated_at': func.now()}, synchronize_session=False)
+        return claimed == 1
+
+    def _update(self, job_id, **values):
+        with self.session_factory() as session, session.begin():
+            session.query(OcrJobs).filter(OcrJobs.id == job_id).update(values)
+
+    def _run(self, job_id, pic_path):
+        try:
+            # cv2、pytesseract 较重，第一个任务执行时才导入
+            from services.pic_reading import pic_to_json
+
+            # 抢占失败时任务由其他进程执行；抢占时数据库出错则和识别出错一样记为失败
+            if not self._claim(job_id):
+                return
+            result = pic_to_json(pic_path, with_timings=True)
+            # 附带解析后的结果和校验错误，便于确认后直接登记
+            result['parsed'], result['errors'] = parse_record(result)
+            self._update(
+                job_id,
+                status=JOB_DONE,
+                result=json.dumps(result, ensure_ascii=False, default=_json_default)
+            )
+        except Exception as e:
+            logger.error(f"OCR任务 {job_id} 失败: {e}")
+            try:
+                self._update(job_id, status=JOB_FAILED, error=str(e))
+            except Exception as update_error:
+                logger.error(f"更新OCR任务 {job_id} 状态失败: {update_error}")
@@ -0,0 +1,89 @@
+# OCR 流程耗时统计
+# 记录每张图片各阶段的耗时和 tesseract 调用次数，并在进程内累计，供接口查询
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class ImageTimings:
+    """单张图片的各阶段耗时，OCR 线程会并发累加 tesseract 计数"""
+
+    def __init__(self):
+        self.stages = {}
+        self.tesseract_calls = 0
+        self.tesseract_seconds = 0.0
+        self.cache_hits = 0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def add_tesseract_call(self, seconds):
+        with self._lock:
+            self.tesseract_calls += 1
+            self.tesseract_seconds += seconds
+
+    def add_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def to_dict(self):
+        return {
+            'total_ms': round((time.perf_counter() - self._started) * 1000, 1),
+            'stages_ms': {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            'tesseract_calls': self.tesseract_calls,
+            'tesseract_ms': round(self.tesseract_seconds * 1000, 1),
+            'cache_hits': self.cache_hits,
+        }
+
+
+class OcrStats:
+    """进程内累计的 OCR 统计"""
+
+    def __init__(self):
+        self.images = 0
+        self.total_seconds = 0.0
+        self.stage_seconds = defaultdict(float)
+        self.tesseract_calls = 0
+        self.tesseract_seconds = 0.0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def record(self, timings):
+        with self._lock:
+            self.images += 1
+            self.total_seconds += time.perf_counter() - timings._started
+            for name, seconds in timings.stages.items():
+                self.stage_seconds[name] += seconds
+            self.tesseract_calls += timings.tesseract_calls
+            self.tesseract_seconds += timings.tesseract_seconds
+            self.cache_hits += timings.cache_hits
+
+    def snapshot(self):
+        """返回累计值和每张图片的平均值"""
+        with self._lock:
+            images = self.images or 1
+            return {
+                'images': self.images,
+                'avg_total_ms': round(self.total_seconds / images * 1000, 1),
+                'avg_stages_ms': {
+                    name: round(seconds / images * 1000, 1)
+                    for name, seconds in self.stage_seconds.items()
+                },
+                'tesseract_calls': self.tesseract_calls,
+                'avg_tesseract_calls': round(self.tesseract_calls / images, 2),
+                'avg_tesseract_call_ms': round(
+                    self.tesseract_seconds / (self.tesseract_calls or 1) * 1000, 1
+                ),
+                'cache_hits': self.cache_hits,
+            }
+
+
+ocr_stats = OcrStats()
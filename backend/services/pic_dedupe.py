@@ -0,0 +1,117 @@
+# 记录图片去重
+# 内容哈希识别完全相同的文件；差分哈希（dHash）找出近似图片后，再逐块比较灰度缩略图确认，
+# 避免把只有几个数字不同的两张截图误判为同一张
+import os
+import logging
+from PIL import Image
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from models import RecordPicIndex, OcrJobs
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# dHash 网格大小，共 64 × 16 = 1024 位
+dhash_size = (17, 64)
+# dHash 汉明距离不超过该值的图片才进一步比较
+dhash_max_distance = int(os.getenv('PIC_DHASH_MAX_DISTANCE', 64))
+# 缩略图逐块比较：任意一块平均灰度差超过该值即认为内容不同
+thumbnail_size = (256, 512)
+thumbnail_block = 4
+block_max_diff = float(os.getenv('PIC_BLOCK_MAX_DIFF', 6.0))
+
+
+def difference_hash(image):
+    """按行计算相邻像素的明暗关系，返回 128 字节的 dHash"""
+    import numpy as np
+    gray = np.asarray(image.convert('L').resize(dhash_size, Image.LANCZOS), dtype=np.int16)
+    bits = gray[:, 1:] > gray[:, :-1]
+    return np.packbits(bits).tobytes()
+
+
+def _thumbnail(image):
+    import numpy as np
+    return np.asarray(image.convert('L').resize(thumbnail_size, Image.BILINEAR), dtype=np.int16)
+
+
+def images_match(image_a, image_b):
+    """逐块比较两张图片的灰度缩略图，所有块都足够接近才认为是同一张图片"""
+    import numpy as np
+    a, b = _thumbnail(image_a), _thumbnail(image_b)
+    k = thumbnail_block
+    w, h = thumbnail_size
+    block_diff = np.abs(a - b).reshape(h // k, k, w // k, k).mean(axis=(1, 3))
+    return float(block_diff.max()) <= block_max_diff
+
+
+def find_duplicate(session, content_hash, image):
+    """查找已处理过的相同或近似图片，返回其OCR任务ID，没有时返回 None
+
+    失败的任务不参与去重，以便重新识别。
+    """
+    import numpy as np
+    stmt = select(RecordPicIndex.job_id).join(
+        OcrJobs, OcrJobs.id == RecordPicIndex.job_id
+    ).where(
+        RecordPicIndex.content_hash == content_hash,
+        OcrJobs.status != 'failed'
+    )
+    job_id = session.execute(stmt).scalar()
+    if job_id is not None:
+        return job_id
+
+    rows = session.execute(
+        select(RecordPicIndex.perceptual_hash, OcrJobs.id, OcrJobs.pic_path).join(
+            OcrJobs, OcrJobs.id == RecordPicIndex.job_id
+        ).where(OcrJobs.status != 'failed')
+    ).all()
+    if not rows:
+        return None
+
+    # 一次性计算与所有已有图片的 dHash 汉明距离
+    target = np.frombuffer(difference_hash(image), dtype=np.uint8)
+    hashes = np.frombuffer(b''.join(row[0] for row in rows), dtype=np.uint8).reshape(len(rows), -1)
+    distances = np.unpackbits(hashes ^ target, axis=1).sum(axis=1)
+
+    for i in np.argsort(distances):
+        if distances[i] > dhash_max_distance:
+            break
+        _, candidate_job_id, candidate_path = rows[i]
+        if not os.path.exists(candidate_path):
+            continue
+        with Image.open(candidate_path) as candidate:
+            if images_match(image, candidate):
+                return candidate_job_id
+    return None
+
+
+def register(session, content_hash, image, job_id):
+    """登记新图片，同一内容并发上传时只保留第一条
+
+    已登记的图片对应的任务失败时，改为指向新任务，以便之后的上传能命中重新识别的结果。
+    """
+    perceptual_hash = difference_hash(image)
+    try:
+        with session.begin_nested():
+            session.add(RecordPicIndex(
+                content_hash=content_hash,
+                perceptual_hash=perceptual_hash,
+                job_id=job_id
+            ))
+        return
+    except IntegrityError:
+        pass
+
+    failed_job_ids = select(OcrJobs.id).where(OcrJobs.status == 'failed')
+    replaced = session.execute(
+        update(RecordPicIndex)
+        .where(
+            RecordPicIndex.content_hash == content_hash,
+            RecordPicIndex.job_id.in_(failed_job_ids)
+        )
+        .values(job_id=job_id, perceptual_hash=perceptual_hash)
+    ).rowcount
+    if replaced:
+        logger.info(f"图片原任务失败，改为指向新任务 {job_id}: {content_hash}")
+    else:
+        logger.info(f"图片已登记: {content_hash}")
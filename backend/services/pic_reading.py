@@ -1,101 +1,430 @@
 import json
+import os
+import sys
+import threading
+import time
+from functools import lru_cache
+from types import MappingProxyType
+from typing import NamedTuple, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import pytesseract
 from PIL import Image
 import cv2
 import numpy as np
+from services.ocr_cache import ocr_cache
+from services.ocr_metrics import ImageTimings, ocr_stats
 
 
 default_anchor = (132, 502)
-default_relative_boxes = {
+# 以下坐标基于模板截图，只读，每张图片的实际坐标由 get_layout 计算
+default_relative_boxes = MappingProxyType({
     'game_name': (135, 250, 580, 40),
     'chip_level': (90, 360, 210, 30),
     'game_hands_count': (340, 360, 180, 30),
     'creator_player_name': (530, 360, 220, 30),
     'start_time': (300, 425, 135, 26),
     'end_time': (453, 425, 120, 26)
-}
-default_record_list_params = {
+})
+default_record_list_params = MappingProxyType({
     'record_list_anchor': (150, 925),
     'record_row_height': 75,
     'player_name_width': 250,
     'hands_width': 100,
     'buy_in_width': 125,
     'score_width': 150,
-}
+})
 
-def pic_to_json(pic_path):
+# 锚点模板及其所在截图的宽度，用于估计不同分辨率截图的缩放比例
+anchor_img_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'anchor_img.jpg')
+reference_width = 828
+# 粗匹配时的降采样比例，以及在估计比例附近搜索的相对缩放范围
+anchor_coarse_factor = 0.5
+anchor_scale_range = np.linspace(0.8, 1.2, 9)
+
+# 行内像素标准差低于该值视为空行，玩家列表到此结束
+blank_row_std = float(os.getenv('OCR_BLANK_ROW_STD', 8.0))
+
+# 每条玩家记录的列，按从左到右的顺序
+record_columns = ['player_name', 'hands_count', 'buy_in_count', 'score']
+
+# OCR 并发数，tesseract 在子进程中运行，线程池即可并行
+ocr_max_workers = int(os.getenv('OCR_MAX_WORKERS', os.cpu_count() or 4))
+# OCR 模式：crop 逐个区域识别；layout 整块识别后按坐标分配到各区域
+ocr_mode = os.getenv('OCR_MODE', 'crop')
+ocr_lang = 'chi_sim+eng'
+# OCR 预处理：none 使用原图；gray 灰度；binary 灰度后用 Otsu 二值化
+ocr_preprocess = os.getenv('OCR_PREPROCESS', 'binary')
+# 高度不足的文字区域先放大到该高度再识别
+min_text_height = 48
+
+# 数字类字段只识别英文和白名单字符，比中英文混合识别更快更准
+_digits_config = '--psm 7 -c tessedit_char_whitelist=0123456789'
+field_ocr_params = MappingProxyType({
+    'chip_level': ('eng', _digits_config + '/'),
+    'game_hands_count': ('eng', _digits_config),
+    'start_time': ('eng', _digits_config + '-:/'),
+    'end_time': ('eng', _digits_config + '-:/'),
+    'hands_count': ('eng', _digits_config),
+    'buy_in_count': ('eng', _digits_config),
+    'score': ('eng', _digits_config + '+-,.'),
+})
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+
+class ImageLayout(NamedTuple):
+    """单张图片中各区域的绝对坐标，不可变，可在多个线程间共享"""
+    header_boxes: Tuple[Tuple[str, Tuple[int, int, int, int]], ...]
+    record_list_anchor: Tuple[int, int]
+    record_row_height: int
+    column_widths: Tuple[int, ...]
+
+    @property
+    def record_width(self):
+        return sum(self.column_widths)
+
+    def record_row_boxes(self, row_index):
+        """第 row_index 行玩家记录各列的区域，顺序与 record_columns 一致"""
+        x, y = self.record_list_anchor
+        y += row_index * self.record_row_height
+        boxes = []
+        for width in self.column_widths:
+            boxes.append((x, y, width, self.record_row_height))
+            x += width
+        return boxes
+
+
+def pic_to_json(pic_path, mode=None, with_timings=False):
+    """识别一张记录截图
+
+    with_timings 为 True 时在结果中附带各阶段耗时和 tesseract 调用次数；
+    无论是否返回，耗时都会累计到 ocr_stats。
+    """
+    timings = ImageTimings()
+
+    with timings.stage('decode'):
+        image = Image.open(pic_path)
+        # 先完整解码，避免多个线程同时触发懒加载
+        image.load()
+    with timings.stage('grayscale'):
+        # 整张图片只做一次灰度化，锚点匹配、空行检测和预处理共用
+        gray = _to_gray(np.asarray(image))
+    with timings.stage('anchor'):
+        anchor_loc, scale = locate_anchor(gray)
+        layout = get_layout(anchor_loc, scale)
+    with timings.stage('preprocess'):
+        ocr_image = preprocess_image(image, gray)
+
+    header_keys = [key for key, _ in layout.header_boxes]
+    header_boxes = [box for _, box in layout.header_boxes]
+
+    # 只识别玩家列表中有内容的行
+    rh = layout.record_row_height
+    ry = layout.record_list_anchor[1]
+    with timings.stage('row_detection'):
+        rows_count = count_record_rows(gray, layout.record_list_anchor, rh, layout.record_width)
+    total_rows_count = max(-(-(image.height - ry) // rh), 0)
+
+    record_boxes = []
+    for row_index in range(rows_count):
+        record_boxes.extend(layout.record_row_boxes(row_index))
+
+    mode = mode or ocr_mode
+    with timings.stage('ocr'):
+        if mode == 'layout':
+            # 表头和玩家列表各做一次整块识别
+            executor = _get_ocr_executor()
+            header_future = executor.submit(ocr_boxes_layout, ocr_image, header_boxes, timings=timings)
+            record_future = executor.submit(ocr_boxes_layout, ocr_image, record_boxes, timings=timings)
+            texts = header_future.result() + record_future.result()
+        elif mode == 'crop':
+            # 所有区域并行识别，结果顺序与 boxes 一致
+            fields = header_keys + record_columns * rows_count
+            texts = ocr_boxes(ocr_image, header_boxes + record_boxes, fields, timings)
+        else:
+            raise ValueError(f"未知的OCR模式: {mode}")
+
+    result = dict(zip(header_keys, texts[:len(header_keys)]))
+    record_texts = texts[len(header_keys):]
+    cols = len(record_columns)
+    result['record_list'] = [
+        dict(zip(record_columns, record_texts[i:i+cols]))
+        for i in range(0, len(record_texts), cols)
+    ]
+    result['skipped_row_count'] = total_rows_count - rows_count
+
+    ocr_stats.record(timings)
+    if with_timings:
+        result['timings'] = timings.to_dict()
+    return result
+
+
+def count_record_rows(gray, record_list_anchor, row_height, row_width):
+    """根据每行像素的标准差找到玩家列表的末尾，返回有内容的行数
+
+    gray 为整张图片的灰度数组。从列表起点逐行向下，遇到第一条几乎没有明暗变化的空行即认为列表结束。
+    """
+    rx, ry = record_list_anchor
+    height, width = gray.shape
+    x0, x1 = max(rx, 0), min(rx + row_width, width)
+    y0 = max(ry, 0)
+    if x1 <= x0 or y0 >= height:
+        return 0
+
+    # 只统计完整的行，一次性计算每行的标准差
+    full_rows = (height - y0) // row_height
+    bands = gray[y0:y0 + full_rows * row_height, x0:x1].reshape(full_rows, row_height, x1 - x0)
+    row_std = bands.std(axis=(1, 2), dtype=np.float32)
+
+    blank = np.flatnonzero(row_std < blank_row_std)
+    return int(blank[0]) if len(blank) else full_rows
+
+
+def set_ocr_max_workers(max_workers):
+    """调整 OCR 并发数，下次识别时生效"""
+    global ocr_max_workers, _ocr_executor
+    with _ocr_executor_lock:
+        ocr_max_workers = max_workers
+        old_executor, _ocr_executor = _ocr_executor, None
+    if old_executor is not None:
+        old_executor.shutdown(wait=False)
+
+
+def _get_ocr_executor():
+    global _ocr_executor
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            _ocr_executor = ThreadPoolExecutor(
+                max_workers=ocr_max_workers,
+                thread_name_prefix='ocr'
+            )
+        return _ocr_executor
+
+
+def ocr_boxes(image, boxes, fields=None, timings=None):
+    """并行识别多个区域，按 boxes 的顺序返回文本
+
+    fields: 与 boxes 一一对应的字段名，用于选择识别语言和字符白名单
+    """
+    fields = fields or [None] * len(boxes)
+    return list(_get_ocr_executor().map(
+        lambda args: crop_and_ocr(image, *args, timings=timings), zip(boxes, fields)
+    ))
+
+
+def preprocess_image(image, gray=None, method=None):
+    """对整张图片做一次 OCR 预处理，之后所有区域都从处理后的图片裁剪
+
+    binary 模式用 Otsu 阈值二值化，深色背景时反相为白底黑字。
+    """
+    method = method or ocr_preprocess
+    if method == 'none':
+        return image
+    if gray is None:
+        gray = _to_gray(np.asarray(image))
+    if method == 'gray':
+        return Image.fromarray(gray)
+    if method == 'binary':
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if binary.mean() < 127:
+            binary = cv2.bitwise_not(binary)
+        return Image.fromarray(binary)
+    raise ValueError(f"未知的预处理方式: {method}")
 
-    image = Image.open(pic_path)
-    image_array = np.array(image)
-    anchor_loc = get_anchor_loc(image_array)
-    relative_boxes, record_list_params = get_relative_boxes(anchor_loc)
-    
-    game_name = crop_and_ocr(image, relative_boxes['game_name'])
-    chip_level = crop_and_ocr(image, relative_boxes['chip_level'])
-    game_hands_count = crop_and_ocr(image, relative_boxes['game_hands_count'])
-    creator_player_name = crop_and_ocr(image, relative_boxes['creator_player_name'])
-    start_time = crop_and_ocr(image, relative_boxes['start_time'])
-    end_time = crop_and_ocr(image, relative_boxes['end_time'])
-
-    rx, ry = record_list_params['record_list_anchor']
-    rh = record_list_params['record_row_height']
-    nw = record_list_params['player_name_width']
-    hw = record_list_params['hands_width']
-    biw = record_list_params['buy_in_width']
-    sw = record_list_params['score_width']
-
-    record_list = []
-    while ry < image.height:
-        player_name = crop_and_ocr(image, (rx, ry, nw, rh))
-        hands = crop_and_ocr(image, (rx+nw, ry, hw, rh))
-        buy_in = crop_and_ocr(image, (rx+nw+hw, ry, biw, rh))
-        score = crop_and_ocr(image, (rx+nw+hw+biw, ry, sw, rh))
-        record_list.append({
-            'player_name': player_name,
-            'hands_count': hands,
-            'buy_in_count': buy_in,
-            'score': score
-        })
-        ry += rh
-
-    return {
-        'game_name': game_name,
-        'chip_level': chip_level,
-        'game_hands_count': game_hands_count,
-        'creator_player_name': creator_player_name,
-        'start_time': start_time,
-        'end_time': end_time,
-        'record_list': record_list
-    }
+
+def ocr_boxes_layout(image, boxes, min_overlap=0.5, timings=None):
+    """对所有区域的外接矩形只调用一次 image_to_data，再按坐标重叠把单词分配到各区域
+
+    单词与某个区域的重叠面积超过自身面积的 min_overlap 时归入该区域，
+    同一区域内同一行的单词用空格连接，不同行用换行连接。
+    """
+    if not boxes:
+        return []
+
+    cells = np.array(boxes, dtype=np.int64)
+    x0 = max(int(cells[:, 0].min()), 0)
+    y0 = max(int(cells[:, 1].min()), 0)
+    x1 = min(int((cells[:, 0] + cells[:, 2]).max()), image.width)
+    y1 = min(int((cells[:, 1] + cells[:, 3]).max()), image.height)
+    if x1 <= x0 or y1 <= y0:
+        return [''] * len(boxes)
+
+    region = image.crop((x0, y0, x1, y1))
+    started = time.perf_counter()
+    data = pytesseract.image_to_data(region, lang=ocr_lang, output_type=pytesseract.Output.DICT)
+    if timings is not None:
+        timings.add_tesseract_call(time.perf_counter() - started)
+
+    words = [
+        (i, data['text'][i].strip())
+        for i in range(len(data['text']))
+        if data['text'][i].strip()
+    ]
+    if not words:
+        return [''] * len(boxes)
+
+    # 单词坐标换算回整张图片
+    index = [i for i, _ in words]
+    wl = np.array([data['left'][i] for i in index]) + x0
+    wt = np.array([data['top'][i] for i in index]) + y0
+    ww = np.array([data['width'][i] for i in index])
+    wh = np.array([data['height'][i] for i in index])
+
+    # 单词×区域 的重叠面积矩阵
+    overlap_w = np.minimum(wl[:, None] + ww[:, None], cells[None, :, 0] + cells[None, :, 2]) \
+        - np.maximum(wl[:, None], cells[None, :, 0])
+    overlap_h = np.minimum(wt[:, None] + wh[:, None], cells[None, :, 1] + cells[None, :, 3]) \
+        - np.maximum(wt[:, None], cells[None, :, 1])
+    overlap = np.clip(overlap_w, 0, None) * np.clip(overlap_h, 0, None)
+    best_cell = overlap.argmax(axis=1)
+    word_area = np.maximum(ww * wh, 1)
+    matched = overlap[np.arange(len(words)), best_cell] >= word_area * min_overlap
+
+    # tesseract 按阅读顺序输出单词，逐个归入所属区域
+    cell_lines = [{} for _ in boxes]
+    for k, (i, word) in enumerate(words):
+        if not matched[k]:
+            continue
+        line_key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        cell_lines[best_cell[k]].setdefault(line_key, []).append(word)
+
+    return ['\n'.join(' '.join(line) for line in lines.values()) for lines in cell_lines]
 
 def get_anchor_loc(image):
     # 在image中寻找anchor_img的坐标，并返回坐标
-    anchor_pic_path = r'anchor_img.jpg'
-    anchor_img = Image.open(anchor_pic_path)
-    anchor_img_array = np.array(anchor_img)
-    result = cv2.matchTemplate(image, anchor_img_array, cv2.TM_CCOEFF_NORMED)
-    
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-    return max_loc
-
-
-def get_relative_boxes(anchor_loc):
-    dx, dy = anchor_loc[0] - default_anchor[0], anchor_loc[1] - default_anchor[1]
-    for key, value in default_relative_boxes.items():
-        x0, y0, w, h = value
-        default_relative_boxes[key] = (x0+dx, y0+dy, w, h)
+    anchor_loc, _ = locate_anchor(image)
+    return anchor_loc
+
+
+@lru_cache(maxsize=1)
+def _load_anchor_template():
+    """加载锚点模板并转为灰度，只在首次调用时读取文件"""
+    anchor_img = Image.open(anchor_img_path).convert('L')
+    return np.array(anchor_img)
+
+
+def _to_gray(image_array):
+    if image_array.ndim == 2:
+        return image_array
+    if image_array.shape[2] == 4:
+        return cv2.cvtColor(image_array, cv2.COLOR_RGBA2GRAY)
+    return cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+
+
+def _match(image, template):
+    """返回模板在图片中的最佳匹配得分和左上角坐标"""
+    if template.shape[0] > image.shape[0] or template.shape[1] > image.shape[1]:
+        return -1.0, (0, 0)
+    result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    return max_val, max_loc
+
+
+def _resize(image, scale):
+    if scale == 1:
+        return image
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
 
-    for key, value in default_record_list_params.items():
-        if key == 'record_list_anchor':
-            x0, y0 = value
-            default_record_list_params[key] = (x0+dx, y0+dy)
-        
-    return default_relative_boxes, default_record_list_params
 
+def locate_anchor(image_array):
+    """多尺度查找锚点，返回锚点左上角坐标和截图相对模板的缩放比例
 
-def crop_and_ocr(image, box):
+    先在降采样的灰度图上按多个缩放比例粗匹配，再在原分辨率下只对粗匹配位置附近的小窗口精确匹配。
+    """
+    gray = _to_gray(image_array)
+    template = _load_anchor_template()
+
+    # 粗匹配：以截图宽度估计缩放比例，在其附近搜索
+    f = anchor_coarse_factor
+    coarse = _resize(gray, f)
+    base_scale = gray.shape[1] / reference_width
+    best_val, best_loc, best_scale = -1.0, (0, 0), base_scale
+    for scale in base_scale * anchor_scale_range:
+        val, loc = _match(coarse, _resize(template, scale * f))
+        if val > best_val:
+            best_val, best_loc, best_scale = val, loc, scale
+
+    # 精确匹配：原分辨率下在粗匹配位置附近的窗口内搜索，并微调缩放比例
+    step = base_scale * (anchor_scale_range[1] - anchor_scale_range[0])
+    margin = int(round(2 / f)) + 4
+    x, y = int(best_loc[0] / f), int(best_loc[1] / f)
+    refined_val, refined_loc, refined_scale = -1.0, (x, y), best_scale
+    for scale in (best_scale - step / 2, best_scale, best_scale + step / 2):
+        scaled_template = _resize(template, scale)
+        th, tw = scaled_template.shape
+        wx0, wy0 = max(x - margin, 0), max(y - margin, 0)
+        window = gray[wy0:y + th + margin, wx0:x + tw + margin]
+        val, loc = _match(window, scaled_template)
+        if val > refined_val:
+            refined_val, refined_loc, refined_scale = val, (loc[0] + wx0, loc[1] + wy0), scale
+
+    return refined_loc, float(refined_scale)
+
+
+def get_layout(anchor_loc, scale=1.0):
+    """根据锚点位置和缩放比例计算各区域的绝对坐标，不修改模块级的默认坐标"""
+    ax, ay = anchor_loc
+    dax, day = default_anchor
+
+    def to_point(x, y):
+        return ax + int(round((x - dax) * scale)), ay + int(round((y - day) * scale))
+
+    def to_length(length):
+        return int(round(length * scale))
+
+    header_boxes = tuple(
+        (key, to_point(x0, y0) + (to_length(w), to_length(h)))
+        for key, (x0, y0, w, h) in default_relative_boxes.items()
+    )
+    params = default_record_list_params
+    return ImageLayout(
+        header_boxes=header_boxes,
+        record_list_anchor=to_point(*params['record_list_anchor']),
+        record_row_height=to_length(params['record_row_height']),
+        column_widths=tuple(
+            to_length(params[key])
+            for key in ['player_name_width', 'hands_width', 'buy_in_width', 'score_width']
+        ),
+    )
+
+
+def get_relative_boxes(anchor_loc, scale=1.0):
+    """返回新的表头区域字典和玩家列表参数字典（兼容旧接口）"""
+    layout = get_layout(anchor_loc, scale)
+    relative_boxes = dict(layout.header_boxes)
+    record_list_params = {
+        'record_list_anchor': layout.record_list_anchor,
+        'record_row_height': layout.record_row_height,
+    }
+    record_list_params.update(zip(
+        ['player_name_width', 'hands_width', 'buy_in_width', 'score_width'],
+        layout.column_widths
+    ))
+    return relative_boxes, record_list_params
+
+
+def crop_and_ocr(image, box, field=None, timings=None):
     region = image.crop((box[0], box[1], box[0]+box[2], box[1]+box[3]))
-    text = pytesseract.image_to_string(region, lang='chi_sim+eng').strip()
+    if 0 < region.height < min_text_height:
+        factor = min_text_height / region.height
+        region = region.resize((round(region.width * factor), min_text_height), Image.BICUBIC)
+    lang, config = field_ocr_params.get(field, (ocr_lang, ''))
+    return ocr_region(region, lang, config, timings)
+
+
+def ocr_region(region, lang=ocr_lang, config='', timings=None):
+    """识别单个区域，相同像素的区域直接使用缓存结果"""
+    key = ocr_cache.make_key(region, lang, config)
+    text = ocr_cache.get(key)
+    if text is None:
+        started = time.perf_counter()
+        text = pytesseract.image_to_string(region, lang=lang, config=config).strip()
+        if timings is not None:
+            timings.add_tesseract_call(time.perf_counter() - started)
+        ocr_cache.set(key, text)
+    elif timings is not None:
+        timings.add_cache_hit()
     return text
 
 
@@ -112,15 +441,37 @@ def t_show_relative_boxes():
     pic_path = r'mock_record_pic.jpg'
     image = Image.open(pic_path)
     image_array = np.array(image)
-    anchor_loc = get_anchor_loc(image_array)
-    relative_boxes, record_list_params = get_relative_boxes(anchor_loc)
+    anchor_loc, scale = locate_anchor(image_array)
+    relative_boxes, record_list_params = get_relative_boxes(anchor_loc, scale)
     show_relative_boxes(image_array, relative_boxes)
 
+def t_benchmark_ocr_modes(pic_path=r'mock_record_pic.jpg', repeat=3):
+    """对比逐区域识别与整块识别两种模式的耗时"""
+    for mode in ['crop', 'layout']:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            res = pic_to_json(pic_path, mode=mode)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{mode}: {elapsed:.3f}s/张, {len(res['record_list'])} 行记录")
+        print(json.dumps(res, indent=4, ensure_ascii=False))
+
+def t_concurrent_parse(pic_path=r'mock_record_pic.jpg', threads=16):
+    """多个线程同时解析同一张图片，检查结果完全一致"""
+    results = []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda _: pic_to_json(pic_path), range(threads)))
+
+    expected = pic_to_json(pic_path)
+    mismatched = [i for i, res in enumerate(results) if res != expected]
+    assert not mismatched, f"第 {mismatched} 次解析结果不一致"
+    print(f"✅ {threads} 个线程解析结果一致")
+
 def main():
-    pic_path = r'../uploads/20250711024727.jpg'
+    # 用法: python -m services.pic_reading <图片路径>；批量导入请使用 batch_import.py
+    pic_path = sys.argv[1] if len(sys.argv) > 1 else r'../uploads/20250711024727.jpg'
     res = pic_to_json(pic_path)
 
-    res = json.dumps(res, indent=4)
+    res = json.dumps(res, indent=4, ensure_ascii=False)
     print(res)
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+# 玩家名索引
+# 进程内缓存 players 表，精确查找走字典，OCR 识别有误的名字通过 n-gram 倒排索引找候选后按编辑距离匹配
+import threading
+import unicodedata
+import logging
+from collections import Counter, defaultdict
+from sqlalchemy import select, event
+from sqlalchemy.orm import Session
+from models import Players
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def normalize_name(name):
+    """统一全角半角、大小写，并去掉 OCR 常插入的空白"""
+    name = unicodedata.normalize('NFKC', name or '')
+    return ''.join(name.split()).lower()
+
+
+def edit_distance(a, b, max_distance=None):
+    """Levenshtein 编辑距离，超过 max_distance 时提前返回 max_distance + 1"""
+    if a == b:
+        return 0
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)
+            ))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def _is_cjk(char):
+    return '\u3400' <= char <= '\u9fff' or '\uf900' <= char <= '\ufaff' or '\U00020000' <= char <= '\U0002ffff'
+
+
+def allowed_distance(name):
+    """按名字长度决定允许的编辑距离，名字越短越严格"""
+    if len(name) < 3:
+        return 0
+    # 三个字的中文名改一个字就是另一个人（张三丰 / 李三丰），不做模糊匹配
+    if len(name) <= 3 and any(_is_cjk(char) for char in name):
+        return 0
+    if len(name) < 8:
+        return 1
+    return 2
+
+
+def _digits(key):
+    return ''.join(char for char in key if char.isdigit())
+
+
+class PlayerNameIndex:
+    """玩家名到 Players.id 的内存索引"""
+
+    def __init__(self, n=2, max_candidates=20):
+        self.n = n
+        self.max_candidates = max_candidates
+        self.loaded = False
+        self._ids = {}
+        self._names = {}
+        self._grams = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def _ngrams(self, key):
+        padded = f"^{key}$"
+        return {padded[i:i + self.n] for i in range(max(len(padded) - self.n + 1, 1))}
+
+    def load(self, session):
+        """从 players 表全量加载"""
+        rows = session.execute(select(Players.name, Players.id)).all()
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+            self._grams.clear()
+            for name, player_id in rows:
+                self._add(name, player_id)
+            self.loaded = True
+        logger.info(f"玩家名索引已加载: {len(rows)} 名玩家")
+
+    def ensure_loaded(self, session):
+        if not self.loaded:
+            self.load(session)
+
+    def add(self, name, player_id):
+        """新玩家写入数据库后加入索引"""
+        with self._lock:
+            self._add(name, player_id)
+
+    def _add(self, name, player_id):
+        key = normalize_name(name)
+        self._ids[key] = player_id
+        self._names[key] = name
+        for gram in self._ngrams(key):
+            self._grams[gram].add(key)
+
+    def get(self, name):
+        """精确查找，返回玩家ID或 None"""
+        return self._ids.get(normalize_name(name))
+
+    def match(self, name):
+        """查找最接近的已有玩家，返回 (玩家ID, 玩家名, 编辑距离)，没有足够接近的返回 None
+
+        有多个同样接近的候选时视为无法确定，返回 None。
+        """
+        key = normalize_name(name)
+        if not key:
+            return None
+        with self._lock:
+            if key in self._ids:
+                return self._ids[key], self._names[key], 0
+
+        max_distance = allowed_distance(key)
+        if max_distance == 0:
+            return None
+
+        # 按共享 n-gram 数量挑选候选；add() 可能同时在修改这些集合，持锁读取
+        counter = Counter()
+        with self._lock:
+            for gram in self._ngrams(key):
+                counter.update(self._grams.get(gram, ()))
+            candidates = [
+                (candidate, self._ids[candidate], self._names[candidate])
+                for candidate, _ in counter.most_common(self.max_candidates)
+            ]
+
+        # 都带数字而数字不同的名字视为不同玩家（player1 / player2），
+        # 只有一方带数字时可能是 OCR 把 l、O 识别成了 1、0
+        digits = _digits(key)
+        best = None
+        tie = False
+        for candidate, player_id, player_name in candidates:
+            candidate_digits = _digits(candidate)
+            if digits and candidate_digits and candidate_digits != digits:
+                continue
+            distance = edit_distance(key, candidate, max_distance)
+            if distance > max_distance:
+                continue
+            if best is None or distance < best[2]:
+                best, tie = (player_id, player_name, distance), False
+            elif distance == best[2]:
+                tie = True
+
+        if best is None or tie:
+            return None
+        return best
+
+    def add_after_commit(self, session, name, player_id):
+        """会话中新插入的玩家在事务提交后才加入索引，回滚时丢弃"""
+        session.info.setdefault('pending_player_names', []).append((self, name, player_id))
+
+
+player_name_index = PlayerNameIndex()
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending_player_names(session):
+    for name_index, name, player_id in session.info.pop('pending_player_names', ()):
+        name_index.add(name, player_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_player_names(session):
+    session.info.pop('pending_player_names', None)
@@ -0,0 +1,179 @@
+# OCR 结果解析
+# 把 pic_to_json 返回的字符串字段转换为整数和时间，并校验整局战绩合计为 0，
+# 有问题的记录在写库之前就被拦下
+import re
+from datetime import datetime
+
+# 全角字符转半角，各种减号、破折号统一为 "-"
+_TRANSLATION = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_TRANSLATION.update({
+    ord('　'): ' ',
+    ord('−'): '-',
+    ord('‒'): '-',
+    ord('–'): '-',
+    ord('—'): '-',
+    ord('―'): '-',
+    ord('﹣'): '-',
+    ord('˗'): '-',
+    ord('，'): ',',
+    ord('：'): ':',
+    ord('～'): '~',
+})
+# 数字字段中 OCR 常见的误识别
+_DIGIT_TRANSLATION = dict(_TRANSLATION)
+_DIGIT_TRANSLATION.update({
+    ord('O'): '0',
+    ord('o'): '0',
+    ord('l'): '1',
+    ord('I'): '1',
+    ord('|'): '1',
+})
+
+_INT_RE = re.compile(r'^([+-]?)(\d{1,3}(?:[,.]\d{3})+|\d+)$')
+_CHIP_LEVEL_RE = re.compile(r'^(\d+)/(\d+)$')
+_TIME_RE = re.compile(
+    r'(?:(?P<year>\d{4})[-/.])?(?P<month>\d{1,2})[-/.](?P<day>\d{1,2})\s*'
+    r'(?P<hour>\d{1,2}):(?P<minute>\d{2})'
+)
+_SPACES_RE = re.compile(r'\s+')
+
+# 整局战绩合计允许的误差
+zero_sum_tolerance = 0
+
+
+class RecordParseError(ValueError):
+    """识别结果无法解析或校验不通过"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+def normalize_text(text):
+    """全角转半角、统一减号，并去掉首尾空白；None 视为空字符串"""
+    if text is None:
+        return ''
+    return str(text).translate(_TRANSLATION).strip()
+
+
+def parse_int(text):
+    """解析形如 "+114,201"、"-7.000"、"651" 的整数"""
+    if isinstance(text, int):
+        return text
+    value = _SPACES_RE.sub('', str(text).translate(_DIGIT_TRANSLATION))
+    match = _INT_RE.match(value)
+    if match is None:
+        raise ValueError(f"无法解析为整数: {text!r}")
+    sign, digits = match.groups()
+    number = int(digits.replace(',', '').replace('.', ''))
+    return -number if sign == '-' else number
+
+
+def parse_chip_level(text):
+    """解析形如 "20/40" 的级别，返回 (sb, bb)"""
+    value = _SPACES_RE.sub('', str(text).translate(_DIGIT_TRANSLATION))
+    match = _CHIP_LEVEL_RE.match(value)
+    if match is None:
+        raise ValueError(f"无法解析级别: {text!r}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def parse_time(text, reference_time=None):
+    """解析形如 "7-8 16:50" 的时间
+
+    截图中没有年份时取 reference_time 所在年份，若得到的时间晚于 reference_time 则视为上一年。
+    """
+    if isinstance(text, datetime):
+        return text
+    value = normalize_text(text)
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+
+    match = _TIME_RE.search(value)
+    if match is None:
+        raise ValueError(f"无法解析时间: {text!r}")
+    reference_time = reference_time or datetime.now()
+    year = int(match.group('year') or reference_time.year)
+    parsed = datetime(
+        year,
+        int(match.group('month')),
+        int(match.group('day')),
+        int(match.group('hour')),
+        int(match.group('minute'))
+    )
+    if match.group('year') is None and parsed > reference_time:
+        parsed = parsed.replace(year=year - 1)
+    return parsed
+
+
+def parse_record(raw, reference_time=None):
+    """把一局的识别结果转换为带类型的字典，返回 (解析结果, 错误列表)
+
+    已经是整数或时间的字段原样保留，名字为空的行视为空行跳过。
+    """
+    errors = []
+
+    def convert(path, func, value, *args):
+        try:
+            return func(value, *args)
+        except (TypeError, ValueError) as e:
+            errors.append(f"{path}: {e}")
+            return None
+
+    def required_text(path):
+        value = normalize_text(raw.get(path))
+        if not value:
+            errors.append(f"{path}: 不能为空")
+        return value
+
+    parsed = {
+        'game_name': required_text('game_name'),
+        'creator_player_name': required_text('creator_player_name'),
+        'game_hands_count': convert('game_hands_count', parse_int, raw.get('game_hands_count')),
+    }
+
+    if raw.get('sb') is not None and raw.get('bb') is not None:
+        parsed['sb'] = convert('sb', parse_int, raw['sb'])
+        parsed['bb'] = convert('bb', parse_int, raw['bb'])
+    else:
+        parsed['sb'], parsed['bb'] = convert('chip_level', parse_chip_level, raw.get('chip_level')) or (None, None)
+
+    start_time = convert('start_time', parse_time, raw.get('start_time'), reference_time)
+    end_time = convert('end_time', parse_time, raw.get('end_time'), reference_time)
+    # 跨年的牌局结束时间会被解析到开始时间之前
+    if start_time and end_time and end_time < start_time and end_time.year == start_time.year:
+        end_time = end_time.replace(year=end_time.year + 1)
+    parsed['start_time'] = start_time
+    parsed['end_time'] = end_time
+
+    record_list = []
+    for i, record in enumerate(raw.get('record_list') or []):
+        player_name = normalize_text(record.get('player_name', ''))
+        if not player_name:
+            continue
+        path = f"record_list[{i}]"
+        record_list.append({
+            'player_name': player_name,
+            'hands_count': convert(f"{path}.hands_count", parse_int, record.get('hands_count')),
+            'buy_in_count': convert(f"{path}.buy_in_count", parse_int, record.get('buy_in_count')),
+            'score': convert(f"{path}.score", parse_int, record.get('score')),
+        })
+    parsed['record_list'] = record_list
+
+    if not record_list:
+        errors.append('record_list: 没有玩家记录')
+    scores = [record['score'] for record in record_list]
+    if record_list and None not in scores and abs(sum(scores)) > zero_sum_tolerance:
+        errors.append(f"record_list: 玩家战绩合计为 {sum(scores)}，应为 0")
+
+    return parsed, errors
+
+
+def parse_record_strict(raw, reference_time=None):
+    """解析识别结果，有任何错误时抛出 RecordParseError"""
+    parsed, errors = parse_record(raw, reference_time)
+    if errors:
+        raise RecordParseError(errors)
+    return parsed
@@ -73,8 +73,17 @@ def main():
         # 创建服务管理器
         mysql_manager = MySQLServiceManager()
         
-        # 检查MySQL服务状态
-        if not mysql_manager.check_mysql_service():
+        # 检查MySQL是否可以接受连接，不能时再查询系统服务
+        ready, message = mysql_manager.probe_mysql()
+        if ready:
+            print(f"✅ MySQL服务正在运行: {message}")
+        elif mysql_manager.check_mysql_service():
+            print("⏳ MySQL服务正在启动，等待就绪...")
+            if not mysql_manager.wait_for_mysql_ready(timeout=60):
+                print("❌ MySQL服务启动超时")
+                return 1
+            print("✅ MySQL服务已就绪")
+        else:
             print("🔴 MySQL服务未运行，尝试启动...")
             success, message = mysql_manager.start_mysql_service()
             if success:
@@ -96,8 +105,6 @@ def main():
                 elif mysql_manager.is_macos:
                     print("   1. 运行: brew services start mysql")
                 return 1
-        else:
-            print("✅ MySQL服务正在运行")
         
         print("\n📦 初始化数据库...")
         
@@ -136,7 +143,11 @@ def main():
     
     # 启动Flask应用
     try:
-        from app import app
+        from app import app, ocr_job_manager
+        # 重新排队上次未完成的OCR任务
+        recovered = ocr_job_manager.recover_once()
+        if recovered:
+            print(f"🔁 重新排队 {recovered} 个未完成的OCR任务")
         app.run(
             host=os.getenv('HOST', '0.0.0.0'),
             port=int(os.getenv('PORT', 5000)),